@@ -5,6 +5,10 @@ import pandas as pd
 
 random.seed(42); np.random.seed(42)
 
+def _clamp(x, lo, hi):
+    # スカラー用クランプ（np.clip のディスパッチを避ける）
+    return lo if x < lo else hi if x > hi else x
+
 # =========================
 # Day/Night Cycle
 # =========================
@@ -14,41 +18,47 @@ class DayNightCycle:
         self.night_start = night_start
         self.night_end = night_end
         self.current_tick = 0
+        self._refresh()
     def step(self):
         self.current_tick += 1
-    def get_time_of_day(self):
-        return (self.current_tick % self.day_length) / self.day_length
-    def is_night(self):
-        time = self.get_time_of_day()
-        return self.night_start <= time < self.night_end or time >= self.night_end
-    def is_day(self):
-        return not self.is_night()
-    def get_light_level(self):
-        time = self.get_time_of_day()
+        self._refresh()
+    def _refresh(self):
+        # 全NPCが毎ティック参照するので、昼夜状態はステップ毎に一度だけ計算する
+        time = (self.current_tick % self.day_length) / self.day_length
+        self._time = time
+        self._is_night = self.night_start <= time < self.night_end or time >= self.night_end
         if time < self.night_start:
             progress = time / self.night_start
-            return (math.sin((progress - 0.5) * math.pi) + 1) / 2
+            light = (math.sin((progress - 0.5) * math.pi) + 1) / 2
         elif time < self.night_end:
-            return 0.1
+            light = 0.1
         else:
             progress = (time - self.night_end) / (1.0 - self.night_end)
-            return progress * 0.3
-    def get_sleep_pressure(self):
-        time = self.get_time_of_day()
+            light = progress * 0.3
+        self._light = light
         if self.night_start <= time < self.night_end:
             night_center = (self.night_start + self.night_end) / 2
             distance_from_center = abs(time - night_center)
             max_distance = (self.night_end - self.night_start) / 2
-            pressure = 1.0 - (distance_from_center / max_distance) * 0.5
-            return pressure
+            self._sleep_pressure = 1.0 - (distance_from_center / max_distance) * 0.5
         else:
-            return 0.1
+            self._sleep_pressure = 0.1
+        self._activity_cost = 1.0 + (1.0 - light)
+        self._forage_modifier = 0.3 + light * 0.7
+    def get_time_of_day(self):
+        return self._time
+    def is_night(self):
+        return self._is_night
+    def is_day(self):
+        return not self._is_night
+    def get_light_level(self):
+        return self._light
+    def get_sleep_pressure(self):
+        return self._sleep_pressure
     def get_activity_cost_multiplier(self):
-        light = self.get_light_level()
-        return 1.0 + (1.0 - light)
+        return self._activity_cost
     def get_forage_success_modifier(self):
-        light = self.get_light_level()
-        return 0.3 + light * 0.7
+        return self._forage_modifier
 
 # =========================
 # Predator
@@ -65,8 +75,8 @@ class Predator:
     def pos(self):
         return (self.x, self.y)
     def spawn(self, t):
-        self.x = random.randrange(self.env.size)
-        self.y = random.randrange(self.env.size)
+        self.x = int(self.env.next_rand() * self.env.size)
+        self.y = int(self.env.next_rand() * self.env.size)
         self.active = True
         self.duration = 0
         return self.pos()
@@ -78,11 +88,12 @@ class Predator:
         self.duration += 1
         if self.duration >= self.max_duration:
             self.despawn(); return
-        if random.random() < 0.3:
-            self.x += random.choice([-1, 0, 1])
-            self.y += random.choice([-1, 0, 1])
-            self.x = max(0, min(self.env.size-1, self.x))
-            self.y = max(0, min(self.env.size-1, self.y))
+        env = self.env
+        if env.next_rand() < 0.3:
+            size_m1 = env.size - 1
+            x = self.x + env.next_choice(); y = self.y + env.next_choice()
+            self.x = 0 if x < 0 else size_m1 if x > size_m1 else x
+            self.y = 0 if y < 0 else size_m1 if y > size_m1 else y
     def distance_to(self, npc):
         return abs(self.x - npc.x) + abs(self.y - npc.y)
 
@@ -90,7 +101,10 @@ class Predator:
 # Environment (with slightly buffed forage)
 # =========================
 class EnvForageBuff:
-    def __init__(self, size=40, n_berry=18, n_hunt=10):
+    RAND_POOL_SIZE = 4096
+    GRID_CELL = 8  # NPC近傍グリッドのセル幅（JOIN_RADIUS と同じ）
+
+    def __init__(self, size=40, n_berry=18, n_hunt=10, seed=None):
         self.size = size
         self.berries = {}
         for _ in range(n_berry):
@@ -108,27 +122,94 @@ class EnvForageBuff:
             }
         self.t = 0
         self.day_night = DayNightCycle(day_length=48)
+        self._node_layers = {}
+        # roster-wide columnar event log（NPC ごとの dict リストをやめ、最後に一括で DataFrame 化）
+        self.log_t = []; self.log_name = []; self.log_action = []; self.log_extra = []
+        # batch RNG: pools and vectorised draws all come from this generator
+        self.rng = np.random.default_rng(seed if seed is not None else np.random.randint(2**31))
+        self._refill_rand_pool(); self._refill_choice_pool()
+        # NPC spatial grid: cell -> [npc]（move_towards で逐次更新）
+        self._grid = defaultdict(list); self._npc_by_rid = []
+        # relation matrix R[i, j] = rel of npc i toward npc j（npc.rel は R の行ビュー）
+        self.R = np.zeros((0, 0))
+    # --- pooled RNG (スカラー乱数呼び出しのオーバーヘッドをまとめて償却) ---
+    def _refill_rand_pool(self):
+        self._rand_pool = self.rng.random(self.RAND_POOL_SIZE).tolist(); self._rand_i = 0
+    def _refill_choice_pool(self):
+        self._choice_pool = self.rng.integers(-1, 2, size=self.RAND_POOL_SIZE).tolist(); self._choice_i = 0
+    def next_rand(self):
+        if self._rand_i >= self.RAND_POOL_SIZE: self._refill_rand_pool()
+        r = self._rand_pool[self._rand_i]; self._rand_i += 1
+        return r
+    def next_choice(self):
+        if self._choice_i >= self.RAND_POOL_SIZE: self._refill_choice_pool()
+        c = self._choice_pool[self._choice_i]; self._choice_i += 1
+        return c
+    # --- event log ---
+    def log_event(self, t, name, action, extra=None):
+        self.log_t.append(t); self.log_name.append(name); self.log_action.append(action)
+        self.log_extra.append(extra if extra is not None else {})
+    def log_frame(self):
+        # 付帯情報を1回の from_records で組み、固定列は concat せず先頭に差し込む
+        df = pd.DataFrame.from_records(self.log_extra)
+        df.insert(0, "action", self.log_action); df.insert(0, "name", self.log_name); df.insert(0, "t", self.log_t)
+        return df
+    # --- spatial grid (nearby_allies の O(N) 走査を近傍セルに限定) ---
+    def _cell_of(self, x, y):
+        return (int(x // self.GRID_CELL), int(y // self.GRID_CELL))
+    def register_npc(self, npc):
+        npc.rid = len(self._npc_by_rid); self._npc_by_rid.append(npc)
+        npc._cell = self._cell_of(npc.x, npc.y)
+        self._grid[npc._cell].append(npc)
+        n = len(self._npc_by_rid); R = np.zeros((n, n))
+        R[:n-1, :n-1] = self.R; self.R = R
+        for o in self._npc_by_rid: o.rel = R[o.rid]
+    def grid_update(self, npc):
+        cell = self._cell_of(npc.x, npc.y)
+        if cell != npc._cell:
+            self._grid[npc._cell].remove(npc); self._grid[cell].append(npc)
+            npc._cell = cell
+    def grid_candidates(self, x, y, radius):
+        cx0, cy0 = self._cell_of(x - radius, y - radius)
+        cx1, cy1 = self._cell_of(x + radius, y + radius)
+        out = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                bucket = self._grid.get((cx, cy))
+                if bucket: out.extend(bucket)
+        return out
     def step(self):
         for v in self.berries.values():
             v["abundance"] = min(1.0, v["abundance"] + v["regen"] * (1.0 - v["abundance"]))
-        for v in self.huntzones.values():
-            v["base_success"] = float(np.clip(v["base_success"] + np.random.normal(0, 0.01), 0.03, 0.8))
+        noise = np.random.normal(0, 0.01, len(self.huntzones)).tolist()
+        for v, e in zip(self.huntzones.values(), noise):
+            v["base_success"] = _clamp(v["base_success"] + e, 0.03, 0.8)
         self.t += 1
         self.day_night.step()
+    def _node_layer(self, node_dict):
+        # resource layer -> (keys, (n,2) coords)。ノード数が変わったら作り直す
+        layer = self._node_layers.get(id(node_dict))
+        if layer is None or len(layer[0]) != len(node_dict):
+            keys = list(node_dict.keys())
+            layer = (keys, np.array(keys, dtype=float).reshape(-1, 2))
+            self._node_layers[id(node_dict)] = layer
+        return layer
     def nearest_nodes(self, pos, node_dict, k=4):
-        nodes = list(node_dict.keys())
-        nodes.sort(key=lambda p: abs(p[0] - pos[0]) + abs(p[1] - pos[1]))
-        return nodes[:k]
+        keys, pts = self._node_layer(node_dict)
+        if not keys: return []
+        d = np.abs(pts[:, 0] - pos[0]) + np.abs(pts[:, 1] - pos[1])
+        if k == 1: return [keys[int(d.argmin())]]
+        return [keys[i] for i in np.argsort(d, kind="stable")[:k]]
     def forage(self, pos, node):
         abundance = self.berries[node]["abundance"]
         dist = abs(pos[0] - node[0]) + abs(pos[1] - node[1])
         p = 0.6 * abundance + 0.25 * max(0, 1 - dist / 12)
         modifier = self.day_night.get_forage_success_modifier()
         p *= modifier
-        success = random.random() < p
+        success = self.next_rand() < p
         if success:
-            self.berries[node]["abundance"] = max(0.0, self.berries[node]["abundance"] - random.uniform(0.2, 0.4))
-            food = random.uniform(14, 26) * (0.6 + abundance / 2)
+            self.berries[node]["abundance"] = max(0.0, self.berries[node]["abundance"] - (0.2 + 0.2 * self.next_rand()))
+            food = (14 + 12 * self.next_rand()) * (0.6 + abundance / 2)
         else:
             food = 0.0
         risk = 0.05
@@ -150,14 +231,19 @@ class Territory:
         return (dx**2 + dy**2) <= self.radius**2
 
 class NPCWithTerritory:
+    ACTION_INDEX = {"hunt": 0, "forage": 1, "help": 2}
+
     def __init__(self, name, preset, env, roster_ref, start_pos,
                  horizon=8, horizon_rally=6, rally_ttl=10):
         self.name = name; self.env = env; self.roster_ref = roster_ref
         self.x, self.y = start_pos
+        self._pos = (self.x, self.y)  # move_towards で更新される位置タプル
+        self._nearest_memo = {}       # layer id -> (pos, 最寄りノード)
         self.hunger = 50.0; self.fatigue = 30.0; self.injury = 0.0
         self.alive = True; self.state = "Awake"
         # Alignment / heat
-        self.kappa = defaultdict(lambda: 0.1); self.kappa_min = 0.05
+        self.kappa_arr = np.full(len(self.ACTION_INDEX), 0.1); self.kappa_min = 0.05
+        self.kappa_seen = np.zeros(len(self.ACTION_INDEX), dtype=bool)
         self.E = 0.0; self.T = 0.3
         self.G0 = 0.5; self.g = 0.7; self.eta = 0.3
         self.lambda_forget = 0.02; self.rho = 0.1; self.alpha = 0.6; self.beta_E = 0.15
@@ -169,7 +255,7 @@ class NPCWithTerritory:
         self.risk_tolerance = p["risk_tolerance"]; self.curiosity = p["curiosity"]
         self.avoidance = p["avoidance"]; self.stamina = p["stamina"]; self.empathy = p.get("empathy",0.6)
         self.TH_H = 55.0
-        self.rel = defaultdict(float); self.help_debt = defaultdict(float)
+        self.rel = None; self.help_debt = defaultdict(float)  # rel: env.register_npc で R の行に束縛
         # sleep
         self.sleep_debt = 0.0; self.is_sleeping = False; self.sleep_duration = 0
         self.total_sleep_time = 0; self.sleep_cycles = 0
@@ -180,13 +266,14 @@ class NPCWithTerritory:
         self.group_loyalty = 0.5 + self.empathy * 0.3
         self.detected_intruders = []
         self.invited_guests = set()
-        self.log = []
+        self.last_party = []
         self.boredom = 0.0
         # pantry
         self.max_store = 120.0
         self.food_store = 0.0
         # rally
         self.rally_state = {"leader": None, "ttl": 0, "node": None, "min_k": 2}
+        self.rally_target = None
         self.rally_ttl_default = rally_ttl
         self.horizon = horizon
         self.horizon_rally = horizon_rally
@@ -194,32 +281,47 @@ class NPCWithTerritory:
         self.cohesion = 0.0
         self.village_affinity = 0.0
         self.last_social_tick = 0
+        env.register_npc(self)
 
     # --- utils ---
     def pos(self):
-        return (self.x, self.y)
+        return self._pos
     def dist_to(self, o):
         return abs(self.x - o.x) + abs(self.y - o.y)
     def move_towards(self, target):
         tx, ty = target
         self.x += (1 if tx > self.x else -1 if tx < self.x else 0)
         self.y += (1 if ty > self.y else -1 if ty < self.y else 0)
+        self._pos = (self.x, self.y)
+        self.env.grid_update(self)
+    def nearest_node(self, node_dict):
+        # 位置が変わるまで最寄りノードを使い回す（ノード集合はシミュレーション中固定）
+        hit = self._nearest_memo.get(id(node_dict))
+        if hit is not None and hit[0] == self._pos: return hit[1]
+        nodes = self.env.nearest_nodes(self._pos, node_dict, k=1)
+        node = nodes[0] if nodes else None
+        self._nearest_memo[id(node_dict)] = (self._pos, node)
+        return node
     def nearby_allies(self, radius=3):
-        return [o for on, o in self.roster_ref.items() if on != self.name and o.alive and self.dist_to(o) <= radius]
+        allies = [o for o in self.env.grid_candidates(self.x, self.y, radius) if o is not self and o.alive and self.dist_to(o) <= radius]
+        allies.sort(key=lambda o: o.rid)  # roster 順を維持（max/break の同点処理を従来どおりに）
+        return allies
 
     # --- alignment/heat ---
     def alignment_flow(self, action_type, meaning_pressure):
-        kappa = self.kappa[action_type]
+        idx = self.ACTION_INDEX[action_type]; self.kappa_seen[idx] = True
+        kappa = self.kappa_arr[idx]
         j = (self.G0 + self.g * kappa) * meaning_pressure
         return j
     def update_kappa(self, action_type, success, reward):
-        kappa = self.kappa[action_type]
+        idx = self.ACTION_INDEX[action_type]; self.kappa_seen[idx] = True
+        kappa = self.kappa_arr[idx]
         if success:
             work = self.eta * reward
         else:
             work = -self.rho * (kappa ** 2)
         decay = self.lambda_forget * (kappa - self.kappa_min)
-        self.kappa[action_type] = max(self.kappa_min, kappa + work - decay)
+        self.kappa_arr[idx] = max(self.kappa_min, kappa + work - decay)
     def update_heat(self, meaning_pressure, processed_amount):
         unprocessed = max(0, meaning_pressure - processed_amount)
         self.E += self.alpha * unprocessed - self.beta_E * self.E
@@ -246,14 +348,12 @@ class NPCWithTerritory:
         self.state = "Sleeping"
         self.sleep_cycles += 1
     def consolidate_memory(self):
-        if len(self.kappa) < 2: return
-        actions = list(self.kappa.keys()); values = list(self.kappa.values())
-        mean_kappa = np.mean(values)
-        for action in actions:
-            if self.kappa[action] > mean_kappa:
-                self.kappa[action] = min(1.0, self.kappa[action] + 0.05)
-            else:
-                self.kappa[action] = max(self.kappa_min, self.kappa[action] - self.lambda_forget * 3)
+        seen = self.kappa_seen
+        if seen.sum() < 2: return
+        k = self.kappa_arr
+        up = k > k[seen].mean()
+        consolidated = np.where(up, np.minimum(1.0, k + 0.05), np.maximum(self.kappa_min, k - self.lambda_forget * 3))
+        self.kappa_arr = np.where(seen, consolidated, k)
     def wake_up(self, t, reason):
         self.is_sleeping = False
         self.state = "Awake"
@@ -277,7 +377,7 @@ class NPCWithTerritory:
                 self.detected_intruders.append({"name": ally.name, "npc": ally, "detected_at": t, "threat_level": threat})
     def calculate_threat(self, other_npc):
         base_threat = 0.3
-        relation = self.rel[other_npc.name]
+        relation = float(self.rel[other_npc.rid])
         if relation < 0: base_threat += abs(relation) * 0.5
         elif relation > 0.5: base_threat -= 0.3
         base_threat += other_npc.territorial_aggression * 0.3
@@ -286,30 +386,30 @@ class NPCWithTerritory:
     def react_to_intruder(self, intruder_data, t):
         threat = intruder_data["threat_level"]; other_npc = intruder_data["npc"]
         if threat < 0.3:
-            if self.empathy > 0.7 and random.random() < 0.3:
+            if self.empathy > 0.7 and self.env.next_rand() < 0.3:
                 self.invited_guests.add(other_npc.name)
-                self.rel[other_npc.name] += 0.1; other_npc.rel[self.name] += 0.1
-                self.log.append({"t": t, "name": self.name, "action": "invite_to_territory", "target": other_npc.name, "threat_level": round(threat, 2)})
+                self.rel[other_npc.rid] += 0.1; other_npc.rel[self.rid] += 0.1
+                self.env.log_event(t, self.name, "invite_to_territory", {"target": other_npc.name, "threat_level": round(threat, 2)})
                 return "invited"
         elif threat < 0.6:
             edge_x = self.territory.center[0] + self.territory.radius * 0.8
             edge_y = self.territory.center[1]
             self.move_towards((int(edge_x), int(edge_y)))
-            self.rel[other_npc.name] -= 0.05
-            self.log.append({"t": t, "name": self.name, "action": "warning_distance", "target": other_npc.name, "threat_level": round(threat, 2)})
+            self.rel[other_npc.rid] -= 0.05
+            self.env.log_event(t, self.name, "warning_distance", {"target": other_npc.name, "threat_level": round(threat, 2)})
             return "warned"
         else:
             if self.territorial_aggression > other_npc.territorial_aggression:
                 other_npc.E = min(5.0, other_npc.E + 0.5)
-                other_npc.rel[self.name] -= 0.15; self.rel[other_npc.name] -= 0.1
-                self.log.append({"t": t, "name": self.name, "action": "chase_away", "target": other_npc.name, "threat_level": round(threat, 2)})
+                other_npc.rel[self.rid] -= 0.15; self.rel[other_npc.rid] -= 0.1
+                self.env.log_event(t, self.name, "chase_away", {"target": other_npc.name, "threat_level": round(threat, 2)})
                 return "chased"
             else:
                 escape_x = self.territory.center[0] - (other_npc.x - self.territory.center[0])
                 escape_y = self.territory.center[1] - (other_npc.y - self.territory.center[1])
                 self.move_towards((max(0, min(self.env.size-1, int(escape_x))), max(0, min(self.env.size-1, int(escape_y)))))
                 self.E = min(5.0, self.E + 0.3)
-                self.log.append({"t": t, "name": self.name, "action": "retreat_from_territory", "target": other_npc.name, "threat_level": round(threat, 2)})
+                self.env.log_event(t, self.name, "retreat_from_territory", {"target": other_npc.name, "threat_level": round(threat, 2)})
                 return "retreated"
         return "ignored"
 
@@ -322,56 +422,60 @@ class NPCWithTerritory:
             self.E = min(5.0, self.E + threat_level * 0.3)
             allies = self.nearby_allies(radius=5); warned_count = 0
             for ally in allies:
-                self.rel[ally.name] += 0.05; ally.rel[self.name] += 0.05
+                self.rel[ally.rid] += 0.05; ally.rel[self.rid] += 0.05
                 ally.E = min(5.0, ally.E + threat_level * 0.2); warned_count += 1
             if dist <= 3:
                 escape_x = self.territory.center[0] + (self.x - predator.x) * 2
                 escape_y = self.territory.center[1] + (self.y - predator.y) * 2
                 self.move_towards((max(0, min(self.env.size-1, int(escape_x))), max(0, min(self.env.size-1, int(escape_y)))))
-                self.log.append({"t": t, "name": self.name, "action": "flee_from_predator", "distance": dist, "at_home": self.territory.contains(self.pos())})
+                self.env.log_event(t, self.name, "flee_from_predator", {"distance": dist, "at_home": self.territory.contains(self.pos())})
                 return "fled"
             else:
-                self.log.append({"t": t, "name": self.name, "action": "alert_predator", "distance": dist, "warned_allies": warned_count})
+                self.env.log_event(t, self.name, "alert_predator", {"distance": dist, "warned_allies": warned_count})
                 return "alert"
         return None
 
     # --- help utilities / sharing ---
     def help_utility(self, o):
         need = max(0, (o.hunger - 55) / 40) + max(0, (o.injury - 15) / 50) + max(0, (o.fatigue - 70) / 50)
-        base = 0.35 * self.empathy + 0.4 * self.rel[o.name] + 0.35 * self.help_debt[o.name]
+        base = 0.35 * self.empathy + 0.4 * self.rel[o.rid] + 0.35 * self.help_debt[o.name]
         myneed = max(0, (self.hunger - 55) / 40) + max(0, (self.injury - 15) / 50) + max(0, (self.fatigue - 70) / 50)
         return need * base - 0.4 * myneed
-    def help_utility_territorial(self, o):
+    def help_utility_territorial(self, o, o_at_home=None):
         base_utility = self.help_utility(o)
-        if self.territory.contains(o.pos()): base_utility += 0.3 * self.group_loyalty
+        if o_at_home is None: o_at_home = self.territory.contains(o.pos())
+        if o_at_home: base_utility += 0.3 * self.group_loyalty
         if o.name in self.invited_guests: base_utility += 0.2
         return base_utility
-    def help_utility_with_threat(self, o, predator):
-        base_utility = self.help_utility_territorial(o)
+    def help_utility_with_threat(self, o, predator, o_at_home=None):
+        if o_at_home is None: o_at_home = self.territory.contains(o.pos())
+        base_utility = self.help_utility_territorial(o, o_at_home)
         if predator and predator.active:
             threat_distance = min(predator.distance_to(self), predator.distance_to(o))
             if threat_distance < 10:
                 base_utility += 0.3 * (1 - threat_distance/10)
-                if self.territory.contains(o.pos()): base_utility += 0.2
+                if o_at_home: base_utility += 0.2
         return base_utility
     def maybe_help_territorial(self, t, predator=None):
         allies = self.nearby_allies(radius=3)
         if not allies: return False
         best = None; bestu = 0.0
+        contains = self.territory.contains
         for o in allies:
-            u = self.help_utility_with_threat(o, predator) if predator else self.help_utility_territorial(o)
+            o_at_home = contains(o.pos())
+            u = self.help_utility_with_threat(o, predator, o_at_home) if predator else self.help_utility_territorial(o, o_at_home)
             if u > bestu: bestu = u; best = o
         if best and bestu > 0.05:
             if self.hunger < 85 and best.hunger > 75:
                 delta = 25.0
                 self.hunger = min(120.0, self.hunger + 6.0)
                 best.hunger = max(0.0, best.hunger - delta)
-                self.rel[best.name] += 0.08; best.rel[self.name] += 0.04
+                self.rel[best.rid] += 0.08; best.rel[self.rid] += 0.04
                 best.help_debt[self.name] += 0.2
                 self.update_kappa("help", True, delta * 0.5)
                 if self.territory.contains(self.pos()):
                     self.territory.memory["helped_here"] += 1
-                self.log.append({"t": t, "name": self.name, "action": "share_food_territorial", "target": best.name})
+                self.env.log_event(t, self.name, "share_food_territorial", {"target": best.name})
                 return True
         return False
 
@@ -386,24 +490,34 @@ RALLY_BONUS = 0.70
 JOIN_RADIUS = 8
 JOIN_NEAR   = 3
 
+def hunt_probs(x, y, nx, ny, base_success, light, k, alpha=0.70):
+    """狩り成功確率 (p_solo, p_group) — 集団狩り・単独狩りで共有するスカラー計算"""
+    tw = 1.0 - abs(light - 0.4)/0.6
+    light_mod = 0.35 + 0.65 * max(0.0, tw)
+    dist = abs(x - nx) + abs(y - ny)
+    dist_term = 0.25 * max(0.0, 1.0 - dist/16.0)
+    p_solo = _clamp(base_success*light_mod + dist_term, 0.03, 0.95)
+    p_group = _clamp(1.0 - (1.0 - p_solo)**(1.0 + alpha*(k-1)), 0.10, 0.99)
+    return p_solo, p_group
+
 class NPCRallyHunt(NPCWithTerritory):
     def emit_rally_for_hunt(self, t, hunt_node=None, min_k=2, ttl=10):
         self.rally_state = {"leader": self.name, "ttl": ttl, "node": hunt_node, "min_k": min_k}
-        self.log.append({"t": t, "name": self.name, "action": "rally_for_hunt", "node": hunt_node, "ttl": ttl})
+        self.env.log_event(t, self.name, "rally_for_hunt", {"node": hunt_node, "ttl": ttl})
     def consider_join_rally(self, t):
-        joined = False
+        joined = False; base = None
         for ally in self.nearby_allies(radius=JOIN_RADIUS):
-            rs = getattr(ally, "rally_state", None)
-            if not rs: continue
+            rs = ally.rally_state
             if rs.get("leader") == ally.name and rs.get("ttl",0) > 0:
-                need_pressure = max(0.0, (self.hunger - self.TH_H) / (100 - self.TH_H))
-                base = self.alignment_flow("hunt", need_pressure)
-                u = base + RALLY_BONUS + 0.35 * self.rel[ally.name] - 0.008 * self.fatigue + 0.4 * self.cohesion + 0.4 * self.village_affinity
+                if base is None:  # ループ内で不変 — 最初の有効な呼びかけで1回だけ評価
+                    need_pressure = max(0.0, (self.hunger - self.TH_H) / (100 - self.TH_H))
+                    base = self.alignment_flow("hunt", need_pressure)
+                u = base + RALLY_BONUS + 0.35 * self.rel[ally.rid] - 0.008 * self.fatigue + 0.4 * self.cohesion + 0.4 * self.village_affinity
                 if u >= 0.0 and not self.is_sleeping:
                     target = rs["node"] if rs["node"] else ally.pos()
                     self.move_towards(target)
                     self.state = "rallying"; self.rally_target = ally.name
-                    self.log.append({"t": t, "name": self.name, "action": "join_rally", "leader": ally.name, "u": float(u)})
+                    self.env.log_event(t, self.name, "join_rally", {"leader": ally.name, "u": float(u)})
                     joined = True
                     break
         return joined
@@ -413,96 +527,83 @@ class NPCRallyHunt(NPCWithTerritory):
             return False
         party = [self]
         for ally in self.nearby_allies(radius=JOIN_NEAR):
-            if getattr(ally, "rally_target", None) == self.name and ally.state == "rallying" and ally.alive and not ally.is_sleeping:
+            if ally.rally_target == self.name and ally.state == "rallying" and ally.alive and not ally.is_sleeping:
                 party.append(ally)
         if len(party) < rs.get("min_k", 2):
             return False
         # choose node
         if rs["node"] is None:
-            nodes = self.env.nearest_nodes(self.pos(), self.env.huntzones, k=1)
-            if not nodes: return False
-            node = nodes[0]
+            node = self.nearest_node(self.env.huntzones)
+            if node is None: return False
         else:
             node = rs["node"]
         # probabilities
         hz = self.env.huntzones[node]
-        light = self.env.day_night.get_light_level()
-        tw = 1 - abs(light - 0.4)/0.6
-        light_mod = 0.35 + 0.65 * max(0.0, tw)
-        dist = abs(self.x - node[0]) + abs(self.y - node[1])
-        dist_term = 0.25 * max(0, 1 - dist/16)
-        p_solo = float(np.clip(hz["base_success"]*light_mod + dist_term, 0.03, 0.95))
-        k = len(party); alpha = 0.70
-        p_group = 1 - (1 - p_solo)**(1 + alpha*(k-1))
-        p_group = float(np.clip(p_group, 0.10, 0.99))
+        k = len(party)
+        p_solo, p_group = hunt_probs(self.x, self.y, node[0], node[1], hz["base_success"],
+                                     self.env.day_night.get_light_level(), k)
         for m in party: m.move_towards(node)
         base_inj_prob = 0.15 + 0.7 * hz["danger"]
         size_discount = 0.55 - 0.08 * (k-2)
-        inj_prob = max(0.20, min(0.95, base_inj_prob * max(0.35, size_discount)))
-        success = random.random() < p_group
+        inj_prob = _clamp(base_inj_prob * (size_discount if size_discount > 0.35 else 0.35), 0.20, 0.95)
+        rng = self.env.rng
+        rolls = rng.random(2)  # [success, food amount]
+        success = bool(rolls[0] < p_group)
         if success:
-            base_food = random.uniform(45, 85) * (0.85 + hz["base_success"])  # big game
+            base_food = (45 + 40 * rolls[1]) * (0.85 + hz["base_success"])  # big game
             total_food = base_food * (1 + 0.75*(k-1))
         else:
             total_food = 0.0
-        needs = np.array([max(1.0, m.hunger) for m in party])
+        # payoff / injury for the whole party at once
+        hungers = np.fromiter((m.hunger for m in party), float, k)
+        needs = np.maximum(1.0, hungers)
         shares = (needs / needs.sum()) * total_food if total_food > 0 else np.zeros(k)
-        injuries = []
-        for m, share in zip(party, shares):
-            inj = 0.0
-            if random.random() < inj_prob:
-                base_injury = random.uniform(2, 10) * (0.6 + 0.8*hz["danger"])
-                if not success: base_injury *= 1.15
-                inj = 0.65 * base_injury
-                m.injury = min(120, m.injury + inj)
-            if success and share > 0:
-                before = m.hunger
-                m.hunger = max(0.0, m.hunger - share)
-                eaten = before - m.hunger
-                rem = max(0.0, share - eaten)
+        inj_hit = rng.random(k) < inj_prob
+        inj_scale = 0.65 * (0.6 + 0.8*hz["danger"]) * (1.0 if success else 1.15)
+        inj_amounts = rng.uniform(2, 10, k) * inj_scale * inj_hit
+        new_hungers = np.maximum(0.0, hungers - shares)
+        rems = np.maximum(0.0, shares - (hungers - new_hungers))
+        fed = (shares > 0) & success
+        for i, m in enumerate(party):
+            if inj_hit[i]: m.injury = min(120, m.injury + float(inj_amounts[i]))
+            if fed[i]:
+                share = float(shares[i]); rem = float(rems[i])
+                m.hunger = float(new_hungers[i])
                 if rem > 0:
                     m.food_store = min(m.max_store, m.food_store + rem*0.6)
                 m.fatigue = min(120, max(0, m.fatigue - share * 0.16))
                 m.update_kappa("hunt", True, share * 1.3)
             else:
                 m.update_kappa("hunt", False, 0)
-            injuries.append(inj)
+        injuries = inj_amounts.tolist()
         # cooperative joy / cohesion
+        R = self.env.R; rids = np.fromiter((m.rid for m in party), int, k)
+        delta = 0.18 if success else 0.05
+        R[np.ix_(rids, rids)] += delta * (1.0 - np.eye(k))  # 全ペア相互に +delta（対角は除く）
         if success:
-            for i in range(k):
-                for j in range(i+1, k):
-                    a, b = party[i], party[j]
-                    delta = 0.18
-                    a.rel[b.name] += delta; b.rel[a.name] += delta
             for m in party:
                 m.E = max(0.0, m.E - 0.6)
                 m.group_loyalty = min(1.0, m.group_loyalty + 0.06)
                 m.cohesion = min(1.0, m.cohesion + 0.22)
                 m.territory.attachment_strength = min(1.0, m.territory.attachment_strength + 0.02)
         else:
-            for i in range(k):
-                for j in range(i+1, k):
-                    a, b = party[i], party[j]
-                    delta = 0.05
-                    a.rel[b.name] += delta; b.rel[a.name] += delta
             for m in party:
                 m.cohesion = min(1.0, m.cohesion + 0.05)
         # zone adaptation
-        self.env.huntzones[node]["base_success"] = float(np.clip(hz["base_success"] + (-0.045 if success else 0.012), 0.03, 0.8))
+        self.env.huntzones[node]["base_success"] = _clamp(hz["base_success"] + (-0.045 if success else 0.012), 0.03, 0.8)
         # leader reward
         if success:
-            self.food_store = min(self.max_store, getattr(self, "food_store", 0) + 4.0)
-            for ally in party[1:]: ally.rel[self.name] += 0.06
+            self.food_store = min(self.max_store, self.food_store + 4.0)
+            R[rids[1:], self.rid] += 0.06
         # cleanup
         for m in party:
-            if getattr(m, "rally_target", None) == self.name:
+            if m.rally_target == self.name:
                 m.rally_target = None; m.state = "Awake"
         self.rally_state = {"leader": None, "ttl": 0, "node": None, "min_k": 2}
         # log
-        self.log.append({
-            "t": t, "name": self.name,
-            "action": "rally_group_hunt_success" if success else "rally_group_hunt_failure",
-            "party": [m.name for m in party], "k": k, "total_food": total_food,
+        self.last_party = [m.name for m in party]
+        self.env.log_event(t, self.name, "rally_group_hunt_success" if success else "rally_group_hunt_failure", {
+            "party": self.last_party, "k": k, "total_food": total_food,
             "p_group": p_group, "inj_prob": inj_prob, "injuries": injuries
         })
         return True
@@ -530,79 +631,93 @@ LAMB = 0.9
 DECAY_GRACE = 40
 
 class NPCRallyHuntCommunity(NPCRallyHunt):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # per-tick FoF memo (cleared when env.t advances)
+        self._fof_cache = {}; self._fof_cache_t = -1
+        self._tick_neighbors = {3: [], 4: [], 6: []}  # social_tail で毎ティック更新
     def mark_social(self, t):
         self.last_social_tick = t
     def fof_score(self, j_name):
-        total, w = 0.0, 0.0
-        for k_name, rik in self.rel.items():
-            if k_name == j_name: continue
-            if k_name not in self.roster_ref: continue
-            rkj = self.roster_ref[k_name].rel.get(j_name, 0.0)
-            if rik > 0 and rkj > 0:
-                total += rik * rkj; w += 1.0
-        return (total / w) if w > 0 else 0.0
-    def apply_triadic_closure(self):
-        allies = [o for o in self.nearby_allies(radius=4)]
-        did=False
-        for i in range(len(allies)):
-            for j in range(i+1, len(allies)):
-                a, b = allies[i], allies[j]
-                if self.rel[a.name] > REL_TH and self.rel[b.name] > REL_TH:
-                    inc = TRIAD_GAIN * min(self.rel[a.name], self.rel[b.name])
-                    a.rel[b.name] = max(REL_MIN, min(REL_MAX, a.rel[b.name] + inc))
-                    b.rel[a.name] = max(REL_MIN, min(REL_MAX, b.rel[a.name] + inc)); did=True
-        if did: self.mark_social(self.env.t)
-    def copresence_tick(self):
-        mates = [o for o in self.nearby_allies(radius=3)]
-        any_friend = False
-        for o in mates:
-            if self.rel[o.name] > 0:
-                self.rel[o.name] = min(REL_MAX, self.rel[o.name] + COPRESENCE_GAIN)
-                any_friend = True
-        if any_friend: self.mark_social(self.env.t)
+        if self._fof_cache_t != self.env.t:
+            self._fof_cache = {}; self._fof_cache_t = self.env.t
+        cached = self._fof_cache.get(j_name)
+        if cached is not None: return cached
+        # 友人 k 経由の j への評価: R[self, k] * R[k, j]（両方正のものだけ平均）
+        j = self.roster_ref[j_name].rid
+        rik = self.rel; rkj = self.env.R[:, j]
+        mask = (rik > 0) & (rkj > 0); mask[j] = False; mask[self.rid] = False
+        w = np.count_nonzero(mask)
+        score = float(rik[mask] @ rkj[mask]) / w if w > 0 else 0.0
+        self._fof_cache[j_name] = score
+        return score
+    def apply_triadic_closure(self, allies=None):
+        if allies is None: allies = self.nearby_allies(radius=4)
+        if len(allies) < 2: return
+        ids = np.fromiter((o.rid for o in allies), int, len(allies))
+        friends = ids[self.rel[ids] > REL_TH]  # 閾値を超える友人だけをペアにする
+        if len(friends) < 2: return
+        rels = self.rel[friends]
+        inc = TRIAD_GAIN * np.minimum.outer(rels, rels); np.fill_diagonal(inc, 0.0)
+        R = self.env.R; block = np.ix_(friends, friends)
+        R[block] = np.clip(R[block] + inc, REL_MIN, REL_MAX)
+        self.mark_social(self.env.t)
+    def copresence_tick(self, mates=None):
+        if mates is None: mates = self.nearby_allies(radius=3)
+        if not mates: return
+        ids = np.fromiter((o.rid for o in mates), int, len(mates))
+        ids = ids[self.rel[ids] > 0]
+        if len(ids) == 0: return
+        self.rel[ids] = np.minimum(REL_MAX, self.rel[ids] + COPRESENCE_GAIN)
+        self.mark_social(self.env.t)
     def prosocial_gossip(self, party_names):
-        for a in party_names:
-            if a not in self.roster_ref: continue
-            for b in party_names:
-                if a == b: continue
-                for k_name, rik in self.roster_ref[a].rel.items():
-                    if k_name in party_names: continue
-                    if rik > REL_TH and k_name in self.roster_ref:
-                        target = self.roster_ref[k_name]
-                        target.rel[b] = min(REL_MAX, target.rel.get(b, 0.0) + GOSSIP_GAIN * rik)
+        R = self.env.R
+        party = [self.roster_ref[n] for n in party_names if n in self.roster_ref]
+        outsider = np.ones(R.shape[0], dtype=bool)
+        for m in party: outsider[m.rid] = False
+        for a in party:
+            ks = np.flatnonzero(outsider & (a.rel > REL_TH))
+            if len(ks) == 0: continue
+            gain = GOSSIP_GAIN * a.rel[ks]
+            for b in party:
+                if b is a: continue
+                R[ks, b.rid] = np.minimum(REL_MAX, R[ks, b.rid] + gain)
         self.mark_social(self.env.t)
     def antisocial_spill(self, thief_name):
+        thief = self.roster_ref[thief_name].rid
         witnesses = [o for o in self.nearby_allies(radius=4) if o.name != thief_name]
         for w in witnesses:
-            w.rel[thief_name] = max(REL_MIN, w.rel.get(thief_name, 0.0) - NEG_SPILLOVER)
+            w.rel[thief] = max(REL_MIN, w.rel[thief] - NEG_SPILLOVER)
     def relax_rel(self):
         idle = self.env.t - self.last_social_tick
         if idle <= DECAY_GRACE: return
-        for name, r in list(self.rel.items()):
-            if abs(r) < 0.1:
-                if r > 0: self.rel[name] = max(0.0, r - REL_DECAY)
-                elif r < 0: self.rel[name] = min(0.0, r + REL_DECAY)
-            else:
-                d = REL_DECAY * (0.2 * (1 - min(1.0, abs(r))))
-                if r > 0: self.rel[name] = max(0.0, r - d)
-                elif r < 0: self.rel[name] = min(0.0, r + d)
-    def social_gravity_move(self):
-        cands = self.nearby_allies(radius=6)
+        r = self.rel; a = np.abs(r)
+        d = np.where(a < 0.1, REL_DECAY, REL_DECAY * (0.2 * (1 - np.minimum(1.0, a))))
+        # 0 をまたがないように減衰（行ビューなので in-place で書き戻す）
+        r[:] = np.where(r > 0, np.maximum(0.0, r - d), np.minimum(0.0, r + d))
+    def social_gravity_move(self, cands=None):
+        if cands is None: cands = self.nearby_allies(radius=6)
         if not cands: return False
         def score(o):
-            return self.rel[o.name] + LAMB * self.fof_score(o.name) + 0.2*self.village_affinity
+            return self.rel[o.rid] + LAMB * self.fof_score(o.name) + 0.2*self.village_affinity
         best = max(cands, key=score)
         fof = self.fof_score(best.name)
-        p = min(0.85, 0.12 + 0.25*max(0, self.rel[best.name]) + 0.18*fof + 0.15*self.village_affinity)
-        if random.random() < p:
+        p = min(0.85, 0.12 + 0.25*max(0, self.rel[best.rid]) + 0.18*fof + 0.15*self.village_affinity)
+        if self.env.next_rand() < p:
             self.move_towards(best.pos()); return True
         return False
+    def social_tail(self):
+        # 近傍探索は r=6 の一回だけ。移動しなければ r=4 / r=3 はその部分集合
+        near6 = self.nearby_allies(radius=6)
+        moved = self.social_gravity_move(near6)
+        near4 = self.nearby_allies(radius=4) if moved else [o for o in near6 if self.dist_to(o) <= 4]
+        near3 = [o for o in near4 if self.dist_to(o) <= 3]
+        self._tick_neighbors = {3: near3, 4: near4, 6: near6}
+        self.copresence_tick(near3); self.apply_triadic_closure(near4); self.relax_rel()
     def attempt_rally_group_hunt(self, t):
         ok = super().attempt_rally_group_hunt(t)
         if ok:
-            last = self.log[-1] if len(self.log) > 0 else None
-            if last and "party" in last:
-                self.prosocial_gossip(last["party"])  # spread good reputation
+            self.prosocial_gossip(self.last_party)  # spread good reputation
             self.mark_social(self.env.t)
         return ok
     def step(self, t, predator=None):
@@ -610,9 +725,8 @@ class NPCRallyHuntCommunity(NPCRallyHunt):
         self.village_affinity = max(0.0, self.village_affinity - 0.0005)
         super().step(t, predator)
         # tail social updates
-        self.social_gravity_move()
-        self.copresence_tick(); self.apply_triadic_closure(); self.relax_rel()
-        friends = [o for o in self.nearby_allies(radius=3) if self.rel[o.name] > 0.2]
+        self.social_tail()
+        friends = [o for o in self._tick_neighbors[3] if self.rel[o.rid] > 0.2]
         if friends: self.village_affinity = min(1.0, self.village_affinity + 0.015)
 
 # =========================
@@ -623,52 +737,60 @@ HARD_INJURY  = 85.0
 HARD_FATIGUE = 95.0
 JOIN_NEAR_PRIORITY = 4
 
+def sleep_recovery(fatigue, injury, hunger, E, sleep_debt, stamina, night):
+    """睡眠中1tick分の回復 — 他個体に触れない局所計算 (fatigue, injury, hunger, E, sleep_debt)"""
+    time_bonus = 1.5 if night else 1.0
+    return (max(0, fatigue - 6.0 * time_bonus * (1 + 0.2 * stamina)),
+            max(0, injury - 2.0 * time_bonus),
+            min(120, hunger + 0.5),
+            max(0, E - 0.3 * time_bonus),
+            max(0, sleep_debt - 4.0 * time_bonus))
+
 class NPCPriority(NPCRallyHuntCommunity):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.share_threshold = 50.0
         self.store_fraction  = 0.6
     def in_communal_context(self):
-        peers = [o for o in self.nearby_allies(radius=3) if self.rel[o.name] > 0.3]
+        peers = [o for o in self.nearby_allies(radius=3) if self.rel[o.rid] > 0.3]
         return len(peers) >= 2
     def _need_food_near_term(self):
         return self.hunger >= 70
     def _try_pantry_pull_or_share_request(self, t):
-        if getattr(self, "food_store", 0.0) > 5.0:
+        if self.food_store > 5.0:
             take = min(self.food_store, max(8.0, (self.hunger - 60)))
             self.food_store -= take
             before = self.hunger
             self.hunger = max(0.0, self.hunger - take)
-            self.log.append({"t": t, "name": self.name, "action": "pantry_pull", "got": take, "h_before": before, "h_after": self.hunger})
+            self.env.log_event(t, self.name, "pantry_pull", {"got": take, "h_before": before, "h_after": self.hunger})
             return True
-        allies = sorted(self.nearby_allies(radius=3), key=lambda o: o.rel[self.name], reverse=True)
+        allies = sorted(self.nearby_allies(radius=3), key=lambda o: o.rel[self.rid], reverse=True)
         for ally in allies:
-            if ally.food_store > 12.0 and (ally.rel[self.name] > 0.1 or self.in_communal_context()):
+            if ally.food_store > 12.0 and (ally.rel[self.rid] > 0.1 or self.in_communal_context()):
                 give = min(ally.food_store - 6.0, 12.0)
                 if give > 0:
                     ally.food_store -= give
                     before = self.hunger
                     self.hunger = max(0.0, self.hunger - give)
-                    self.rel[ally.name] += 0.05; ally.rel[self.name] += 0.03
-                    self.log.append({"t": t, "name": self.name, "action": "help_received", "from": ally.name, "got": give})
+                    self.rel[ally.rid] += 0.05; ally.rel[self.rid] += 0.03
+                    self.env.log_event(t, self.name, "help_received", {"from": ally.name, "got": give})
                     return True
         return False
     def _try_quick_forage_home_pref(self, t):
-        nodes = self.env.nearest_nodes(self.pos(), self.env.berries, k=1)
-        if not nodes: return False
-        node = nodes[0]
+        node = self.nearest_node(self.env.berries)
+        if node is None: return False
         self.move_towards(node)
-        success, food, risk, p = self.env.forage(self.pos(), node)
+        success, food, risk, p = self.env.forage(self._pos, node)
         if success:
             before = self.hunger
             self.hunger = max(0.0, self.hunger - food)
             rem = max(0.0, food - (before - self.hunger))
-            if rem > 0: self.food_store = min(self.max_store, getattr(self, "food_store", 0.0) + self.store_fraction*rem)
+            if rem > 0: self.food_store = min(self.max_store, self.food_store + self.store_fraction*rem)
             self.update_kappa("forage", True, food)
-            self.log.append({"t": t, "name": self.name, "action": "eat_success_quick", "food": food})
+            self.env.log_event(t, self.name, "eat_success_quick", {"food": food})
         else:
             self.update_kappa("forage", False, 0)
-            self.log.append({"t": t, "name": self.name, "action": "eat_failure_quick"})
+            self.env.log_event(t, self.name, "eat_failure_quick")
         return True
     def _seek_safe_rest(self, t):
         cx, cy = self.territory.center
@@ -681,7 +803,7 @@ class NPCPriority(NPCRallyHuntCommunity):
     def _continue_rally_move(self, t):
         leader = None
         for o in self.nearby_allies(radius=JOIN_NEAR_PRIORITY+3):
-            if getattr(o, "rally_state", {}).get("leader", None) == o.name and o.rally_state.get("ttl",0) > 0:
+            if o.rally_state["leader"] == o.name and o.rally_state["ttl"] > 0:
                 leader = o; break
         if leader is None: return False
         target = leader.rally_state["node"] if leader.rally_state["node"] else leader.pos()
@@ -689,8 +811,7 @@ class NPCPriority(NPCRallyHuntCommunity):
     def _should_emit_or_refresh_rally(self, t):
         return (self.hunger > self.TH_H or self.forecast_hunger(self.env.t, self.horizon_rally) > self.TH_H) and not self.is_sleeping
     def _emit_or_refresh_rally(self, t):
-        nodes = self.env.nearest_nodes(self.pos(), self.env.huntzones, k=1)
-        target_node = nodes[0] if nodes else None
+        target_node = self.nearest_node(self.env.huntzones)
         if self.rally_state["leader"] is None:
             self.emit_rally_for_hunt(t, hunt_node=target_node, min_k=2, ttl=10)
         else:
@@ -703,51 +824,46 @@ class NPCPriority(NPCRallyHuntCommunity):
     def _forage_is_good_now(self):
         return self.env.day_night.get_light_level() > 0.3 and self.hunger > (self.TH_H - 10)
     def _do_forage_step(self, t):
-        nodes = self.env.nearest_nodes(self.pos(), self.env.berries, k=1)
-        if not nodes: return False
-        node = nodes[0]
+        node = self.nearest_node(self.env.berries)
+        if node is None: return False
         self.move_towards(node)
-        success, food, risk, p = self.env.forage(self.pos(), node)
+        success, food, risk, p = self.env.forage(self._pos, node)
         if success:
             before = self.hunger
             self.hunger = max(0.0, self.hunger - food)
             rem = max(0.0, food - (before - self.hunger))
-            if rem > 0: self.food_store = min(self.max_store, getattr(self, "food_store", 0.0) + self.store_fraction*rem)
+            if rem > 0: self.food_store = min(self.max_store, self.food_store + self.store_fraction*rem)
             self.update_kappa("forage", True, food)
-            self.log.append({"t": t, "name": self.name, "action": "eat_success", "food": food})
+            self.env.log_event(t, self.name, "eat_success", {"food": food})
         else:
             self.update_kappa("forage", False, 0)
-            self.log.append({"t": t, "name": self.name, "action": "eat_failure"})
+            self.env.log_event(t, self.name, "eat_failure")
         return True
     def _should_help_neighbor_now(self):
         allies = self.nearby_allies(radius=3)
         return any(o.hunger > 85 for o in allies)
     def _do_solo_hunt_step(self, t):
-        nodes = self.env.nearest_nodes(self.pos(), self.env.huntzones, k=1)
-        if not nodes: return False
-        node = nodes[0]
+        node = self.nearest_node(self.env.huntzones)
+        if node is None: return False
         self.move_towards(node)
         hz = self.env.huntzones[node]
-        light = self.env.day_night.get_light_level()
-        tw = 1 - abs(light - 0.4)/0.6
-        light_mod = 0.35 + 0.65 * max(0.0, tw)
-        dist = abs(self.x - node[0]) + abs(self.y - node[1])
-        dist_term = 0.25 * max(0, 1 - dist/16)
-        p_solo = float(np.clip(hz["base_success"]*light_mod + dist_term, 0.03, 0.95))
-        success = random.random() < p_solo
+        p_solo, _ = hunt_probs(self.x, self.y, node[0], node[1], hz["base_success"],
+                               self.env.day_night.get_light_level(), 1)
+        rolls = self.env.rng.random(3)  # [success, food/injury amount, injury]
+        success = bool(rolls[0] < p_solo)
         if success:
-            base_food = random.uniform(20, 40) * (0.8 + hz["base_success"]) ; food = base_food
+            base_food = (20 + 20 * rolls[1]) * (0.8 + hz["base_success"]) ; food = float(base_food)
             before = self.hunger
             self.hunger = max(0.0, self.hunger - food)
             rem = max(0.0, food - (before - self.hunger))
-            if rem > 0: self.food_store = min(self.max_store, getattr(self, "food_store", 0.0) + self.store_fraction*rem)
+            if rem > 0: self.food_store = min(self.max_store, self.food_store + self.store_fraction*rem)
             self.update_kappa("hunt", True, food*0.8)
-            self.log.append({"t": t, "name": self.name, "action": "solo_hunt_success", "food": food})
+            self.env.log_event(t, self.name, "solo_hunt_success", {"food": food})
         else:
             inj_prob = 0.15 + 0.7 * hz["danger"]
-            if random.random() < inj_prob: self.injury = min(120, self.injury + random.uniform(2, 8))
+            if rolls[2] < inj_prob: self.injury = min(120, self.injury + float(2 + 6 * rolls[1]))
             self.update_kappa("hunt", False, 0)
-            self.log.append({"t": t, "name": self.name, "action": "solo_hunt_failure"})
+            self.env.log_event(t, self.name, "solo_hunt_failure")
         return True
     def step(self, t, predator=None):
         if not self.alive: return
@@ -760,20 +876,15 @@ class NPCPriority(NPCRallyHuntCommunity):
         if self.hunger >= 100 or self.injury >= 100:
             cause = "hunger" if self.hunger >= 100 else "injury"
             self.alive = False
-            self.log.append({"t": t, "name": self.name, "action": "death", "cause": cause, "at_home": self.territory.contains(self.pos()),
-                             "hunger": round(self.hunger,1), "injury": round(self.injury,1), "fatigue": round(self.fatigue,1)})
+            self.env.log_event(t, self.name, "death", {"cause": cause, "at_home": self.territory.contains(self.pos()),
+                               "hunger": round(self.hunger,1), "injury": round(self.injury,1), "fatigue": round(self.fatigue,1)})
             return
         # sleep branch
         if self.is_sleeping:
             # replicate parent's sleep handling (short form)
             self.sleep_duration += 1; self.total_sleep_time += 1
-            time_bonus = 1.5 if self.env.day_night.is_night() else 1.0
-            recovery = 6.0 * time_bonus * (1 + 0.2 * self.stamina)
-            self.fatigue = max(0, self.fatigue - recovery)
-            self.injury = max(0, self.injury - 2.0 * time_bonus)
-            self.hunger = min(120, self.hunger + 0.5)
-            self.E = max(0, self.E - (0.3 * time_bonus))
-            self.sleep_debt = max(0, self.sleep_debt - 4.0 * time_bonus)
+            self.fatigue, self.injury, self.hunger, self.E, self.sleep_debt = sleep_recovery(
+                self.fatigue, self.injury, self.hunger, self.E, self.sleep_debt, self.stamina, self.env.day_night.is_night())
             if self.env.day_night.get_time_of_day() > 0.7 and self.sleep_duration > 5:
                 self.consolidate_memory()
             should_wake = False; wake_reason = None
@@ -792,7 +903,7 @@ class NPCPriority(NPCRallyHuntCommunity):
         if self.fatigue >= HARD_FATIGUE:
             if self._enter_sleep_now(t): return
         # L2 cooperative context
-        if getattr(self, "state", "") == "rallying":
+        if self.state == "rallying":
             if self._continue_rally_move(t): return
         if self._should_emit_or_refresh_rally(t):
             self._emit_or_refresh_rally(t)
@@ -800,7 +911,7 @@ class NPCPriority(NPCRallyHuntCommunity):
         if self._leader_can_launch_group_hunt_now(t):
             if self.attempt_rally_group_hunt(t): return
         # L3 night modulation
-        if self.env.day_night.is_night() and self.avoidance > 0.4 and random.random() < 0.5:
+        if self.env.day_night.is_night() and self.avoidance > 0.4 and self.env.next_rand() < 0.5:
             pass
         # L4 supply order
         if self._need_food_near_term():
@@ -811,7 +922,7 @@ class NPCPriority(NPCRallyHuntCommunity):
             if self._do_forage_step(t): return
         if self._do_solo_hunt_step(t): return
         # L5 social tail
-        self.social_gravity_move(); self.copresence_tick(); self.apply_triadic_closure(); self.relax_rel()
+        self.social_tail()
         self.update_heat(self.boredom * 0.05, 0)
 
 # =========================
@@ -831,8 +942,9 @@ COLLECTOR = {"risk_tolerance": 0.4, "curiosity": 0.7, "avoidance": 0.6, "stamina
 # =========================
 # Run (example)
 # =========================
-def run_sim(TICKS=400, predator_spawn_interval=80):
-    env = EnvForageBuff(size=40, n_berry=18, n_hunt=10)
+def run_sim(TICKS=400, predator_spawn_interval=80, seed=None):
+    # seed=None なら env.rng は大域の np.random から種を引く（random.seed/np.random.seed で再現可能）
+    env = EnvForageBuff(size=40, n_berry=18, n_hunt=10, seed=seed)
     roster = {}
     npcs = []
     npc_configs = [
@@ -866,7 +978,7 @@ def run_sim(TICKS=400, predator_spawn_interval=80):
             n.step(t, predator)
         env.step()
     # metrics
-    df = pd.concat([pd.DataFrame(n.log) for n in npcs], ignore_index=True) if any(len(n.log)>0 for n in npcs) else pd.DataFrame(columns=["t","name","action"])
+    df = env.log_frame()
     alive = sum(1 for n in npcs if n.alive)
     deaths = df[df["action"]=="death"]
     death_by_cause = deaths["cause"].value_counts().to_dict() if "cause" in deaths.columns else {}
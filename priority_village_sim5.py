@@ -1,5 +1,5 @@
 
-import random, math
+import random, math, heapq
 from collections import defaultdict
 import numpy as np
 import pandas as pd
@@ -25,33 +25,7 @@ class Weather:
             if self.condition == "sunny":
                 if random.random() < 0.3:
                     self.condition = "rainy"
-                    self.int    roster = {}
-    # NPCの人数を16人に大幅増加（4つのグループに分散配置）
-    npc_configs = [
-        # 北西グループ（探索・冒隺重視）
-        ("Pioneer_Alpha", PIONEER, (20, 20)),
-        ("Adventurer_Beta", ADVENTURER, (21, 19)),
-        ("Tracker_Gamma", TRACKER, (19, 21)),
-        ("Scholar_Delta", SCHOLAR, (18, 18)),
-        
-        # 北東グループ（戦闘・守備重視）
-        ("Warrior_Echo", WARRIOR, (60, 20)),
-        ("Guardian_Foxtrot", GUARDIAN, (61, 19)),
-        ("Loner_Golf", LONER, (59, 21)),
-        ("Nomad_Hotel", NOMAD, (58, 18)),
-        
-        # 南西グループ（協力・治療重視）
-        ("Healer_India", HEALER, (20, 60)),
-        ("Diplomat_Juliet", DIPLOMAT, (21, 59)),
-        ("Forager_Kilo", FORAGER, (19, 61)),
-        ("Leader_Lima", LEADER, (18, 58)),
-        
-        # 南東グループ（バランス型）
-        ("Guardian_Mike", GUARDIAN, (60, 60)),
-        ("Tracker_November", TRACKER, (61, 59)),
-        ("Adventurer_Oscar", ADVENTURER, (59, 61)),
-        ("Pioneer_Papa", PIONEER, (58, 58)),
-    ].uniform(0.3, 0.8)
+                    self.intensity = random.uniform(0.3, 0.8)
                 else:
                     self.intensity = random.uniform(0.1, 1.0)
             else: # rainy
@@ -110,6 +84,8 @@ class DayNightCycle:
 # Predator
 # =========================
 class Predator:
+    __slots__ = ("env", "x", "y", "strength", "active", "duration", "max_duration",
+                 "camp_ticks", "camping_node", "camp_radius", "camp_threshold")
     def __init__(self, env, strength=3.0):
         self.env = env
         self.x = random.randrange(env.size)
@@ -145,17 +121,17 @@ class Predator:
         if self.duration >= self.max_duration:
             self.despawn(); return
 
+        env = self.env
         if random.random() < 0.3:
-            self.x += random.choice([-1, 0, 1])
-            self.y += random.choice([-1, 0, 1])
-            self.x = max(0, min(self.env.size-1, self.x))
-            self.y = max(0, min(self.env.size-1, self.y))
-
-        nodes = list(self.env.huntzones.keys())
-        if nodes:
-            near = min(nodes, key=lambda p: abs(p[0]-self.x)+abs(p[1]-self.y))
-            d = abs(near[0]-self.x)+abs(near[1]-self.y)
-            if d <= self.camp_radius:
+            randint = random.randint; size_m1 = env.size - 1
+            x = self.x + randint(-1, 1)
+            y = self.y + randint(-1, 1)
+            self.x = 0 if x < 0 else size_m1 if x > size_m1 else x
+            self.y = 0 if y < 0 else size_m1 if y > size_m1 else y
+
+        if env._huntzone_keys:
+            near = env.huntzone_within(self.x, self.y, self.camp_radius)
+            if near is not None:
                 if self.camping_node == near:
                     self.camp_ticks += 1
                 else:
@@ -174,59 +150,195 @@ class Predator:
 # =========================
 # Environment
 # =========================
+def forage_prob(abundance, dist, light, rain):
+    """採集成功確率 — 乱数も dict も触らない純粋なスカラー計算"""
+    p = 0.6 * abundance + 0.25 * max(0, 1 - dist / 12)
+    p *= light
+    p *= rain
+    return p
+
+def _to_rows(node_dict, dtype):
+    # {座標: {属性}} を構造化配列に移し、dict の値を行番号に置き換える（座標 -> 行の索引になる）
+    rows = np.zeros(len(node_dict), dtype=dtype)
+    for i, (k, v) in enumerate(node_dict.items()):
+        rows[i] = tuple(v[f] for f in dtype.names); node_dict[k] = i
+    return rows
+
 class EnvForageBuff:
+    HUNT_CELL = 2  # 狩場グリッドのセル幅（Predator の camp_radius に合わせる）
+    # ノード属性は構造化配列（毎tickの再生・採集で丸め誤差が積もらないよう float64）。資源 dict は座標 -> 行番号
+    BERRY_DTYPE = np.dtype([("abundance", "f8"), ("regen", "f8")])
+    HUNT_DTYPE  = np.dtype([("base_success", "f8"), ("danger", "f8")])
+    WATER_DTYPE = np.dtype([("quality", "f8")])
+    CAVE_DTYPE  = np.dtype([("safety_bonus", "f8")])
     def __init__(self, size=40, n_berry=18, n_hunt=10, n_water=5, n_caves=4):
         self.size = size
+        # 全資源で重複しないセルをまとめて引く（座標の衝突で要求数より減らないように）
+        cells = [divmod(c, size) for c in random.sample(range(size * size), n_berry + n_hunt + n_water + n_caves)]
+        berry_cells, cells = cells[:n_berry], cells[n_berry:]
+        hunt_cells, cells = cells[:n_hunt], cells[n_hunt:]
+        water_cells, cave_cells = cells[:n_water], cells[n_water:]
         self.berries = {}
-        for _ in range(n_berry):
-            x, y = random.randrange(size), random.randrange(size)
+        for x, y in berry_cells:
             self.berries[(x, y)] = {"abundance": random.uniform(0.3, 0.7), "regen": random.uniform(0.004, 0.015)}
         self.huntzones = {}
-        for _ in range(n_hunt):
-            x, y = random.randrange(size), random.randrange(size)
+        for x, y in hunt_cells:
             self.huntzones[(x, y)] = {"base_success": random.uniform(0.20, 0.50), "danger": random.uniform(0.25, 0.65)}
+        self._invalidate_hunt_keys()
+        # 毎tick更新する列はフィールドビューで直接触る
+        self._berries = _to_rows(self.berries, self.BERRY_DTYPE)
+        self._hunts = _to_rows(self.huntzones, self.HUNT_DTYPE)
+        self._berry_abundance = self._berries["abundance"]; self._berry_regen = self._berries["regen"]
+        self._hunt_base = self._hunts["base_success"]
         
         self.water_sources = {}
-        for _ in range(n_water):
-            x, y = random.randrange(size), random.randrange(size)
+        for x, y in water_cells:
             self.water_sources[(x,y)] = {"quality": random.uniform(0.5, 1.0)}
 
         # Add caves from pasted_content.txt
-        self.caves = {(random.randrange(size), random.randrange(size)): {"safety_bonus": random.uniform(0.7, 0.9)} for _ in range(n_caves)}
+        self.caves = {(x, y): {"safety_bonus": random.uniform(0.7, 0.9)} for x, y in cave_cells}
+        self._waters = _to_rows(self.water_sources, self.WATER_DTYPE)
+        self._caves = _to_rows(self.caves, self.CAVE_DTYPE)
+
+        # 環境が持つ資源レイヤーだけ座標配列をキャッシュ（一時的な dict は heapq で部分選択）
+        self._node_layers = {id(d): None for d in (self.berries, self.huntzones, self.water_sources, self.caves)}
+        self._nearest_cache = {}  # (pos, id(layer), k) -> 近い順のキー。step ごとにクリア
+        self._stacked = None      # 全レイヤーを積んだ座標配列（nearest_of_each 用）
+        # NPC の位置/生存を SoA で保持（nearby_allies を1回のベクトル演算にする）
+        self._npcs = []
+        self._npc_xy = np.zeros((0, 2), dtype=np.int16)
+        self._npc_alive = np.zeros(0, dtype=bool)
+        self._npc_ver = 0  # 位置/生存が変わるたびに増やす（nearby_allies のメモ無効化用）
+        # 関係性/援助負債は rid 添字の行列で保持（npc.rel は R[rid] の行ビュー）
+        self.R = np.zeros((0, 0)); self.HD = np.zeros((0, 0))
+        # 全 NPC 共通の列指向イベントログ（NPC ごとの dict リストをやめ、最後に一括で DataFrame 化）
+        self.log_t = []; self.log_name = []; self.log_action = []; self.log_extra = []
 
         self.t = 0
         self.day_night = DayNightCycle(day_length=48)
         self.weather = Weather()
+        self._refresh_forage_mod()
+
+    def _invalidate_hunt_keys(self):
+        # 狩場は移動しないのでキー/グリッドは一度だけ作る。狩場を増減させたときだけ呼び直す
+        self._huntzone_keys = tuple(self.huntzones)
+        self._hunt_grid = defaultdict(list)
+        for i, (x, y) in enumerate(self._huntzone_keys):
+            self._hunt_grid[(x // self.HUNT_CELL, y // self.HUNT_CELL)].append((i, (x, y)))
+
+    def huntzone_within(self, x, y, radius):
+        # 半径内で最も近い狩場（同距離なら登録順）。近傍セルだけを見る
+        c = self.HUNT_CELL; span = -(-radius // c); cx, cy = x // c, y // c
+        best = None; best_key = (radius + 1, 0)
+        for gx in range(cx - span, cx + span + 1):
+            for gy in range(cy - span, cy + span + 1):
+                for i, node in self._hunt_grid.get((gx, gy), ()):
+                    key = (abs(node[0] - x) + abs(node[1] - y), i)
+                    if key < best_key: best = node; best_key = key
+        return best
 
     def step(self):
-        for v in self.berries.values():
-            v["abundance"] = min(1.0, v["abundance"] + v["regen"] * (1.0 - v["abundance"]))
-        for v in self.huntzones.values():
-            v["base_success"] = float(np.clip(v["base_success"] + np.random.normal(0, 0.01), 0.03, 0.8))
+        self._nearest_cache.clear()
+        a = self._berry_abundance
+        a += self._berry_regen * (1.0 - a); np.minimum(a, 1.0, out=a)
+        hb = self._hunt_base
+        hb += np.random.normal(0, 0.01, size=hb.shape)
+        np.maximum(hb, 0.03, out=hb); np.minimum(hb, 0.8, out=hb)  # np.clip より呼び出しコストが小さい
         self.t += 1
         self.day_night.step()
         self.weather.step()
+        self._refresh_forage_mod()
 
+    def _refresh_forage_mod(self):
+        # 明るさと雨による採集補正は tick 内で不変なので step ごとに1回だけ計算する
+        self._forage_light = self.day_night.get_forage_success_modifier()
+        # 雨が強いと採集成功率が下がる (from pasted_content.txt)
+        self._forage_rain = (1.0 - 0.5 * self.weather.intensity) if self.weather.condition == "rainy" else 1.0
+
+    # --- event log ---
+    def log_event(self, t, name, action, extra=None):
+        self.log_t.append(t); self.log_name.append(name); self.log_action.append(action)
+        self.log_extra.append(extra if extra is not None else {})
+    def log_frame(self):
+        # 付帯情報を1回の from_records で組み、固定列は先頭に差し込む
+        df = pd.DataFrame.from_records(self.log_extra)
+        df.insert(0, "action", self.log_action); df.insert(0, "name", self.log_name); df.insert(0, "t", self.log_t)
+        return df
+
+    def register_npc(self, npc):
+        # NPC を SoA に登録して行番号を返す
+        self._npcs.append(npc)
+        self._npc_xy = np.vstack([self._npc_xy, np.array([[npc.x, npc.y]], dtype=np.int16)])
+        self._npc_alive = np.append(self._npc_alive, npc.alive)
+        self._npc_ver += 1
+        n = len(self._npcs); R = np.zeros((n, n)); HD = np.zeros((n, n))
+        R[:n-1, :n-1] = self.R; HD[:n-1, :n-1] = self.HD; self.R, self.HD = R, HD
+        for i, o in enumerate(self._npcs): o.rel = R[i]; o.help_debt = HD[i]
+        return n - 1
+
+    def _node_layer(self, node_dict):
+        # resource layer -> (keys, (n,2) coords)。ノード数が変わったら作り直す
+        layer = self._node_layers[id(node_dict)]
+        if layer is None or len(layer[0]) != len(node_dict):
+            keys = list(node_dict.keys())
+            layer = (keys, np.array(keys, dtype=np.int16).reshape(-1, 2))
+            self._node_layers[id(node_dict)] = layer
+        return layer
+    def _all_layers(self):
+        # 洞窟・水・ベリー・狩場をこの順で1つの座標配列に積む。どれかのノード数が変わったら作り直す
+        layers = (self.caves, self.water_sources, self.berries, self.huntzones)
+        sizes = tuple(len(d) for d in layers)
+        if self._stacked is None or self._stacked[0] != sizes:
+            keys = [k for d in layers for k in d]
+            offs = np.cumsum((0,) + sizes).tolist()
+            self._stacked = (sizes, keys, offs, np.array(keys, dtype=np.int16).reshape(-1, 2))
+        return self._stacked
+    def nearest_of_each(self, pos):
+        # (洞窟, 水, ベリー, 狩場) それぞれの最寄り1件を (node, 距離) で、距離計算1回で返す。空のレイヤーは (None, None)
+        _, keys, offs, pts = self._all_layers()
+        d = np.abs(pts[:, 0] - pos[0]) + np.abs(pts[:, 1] - pos[1])
+        out = []
+        for a, b in zip(offs, offs[1:]):
+            if b > a:
+                i = a + int(d[a:b].argmin()); out.append((keys[i], d[i].item()))
+            else: out.append((None, None))
+        return out
+    def nearest_known(self, pos, known, k=1):
+        # 既知ノード（KnowledgeMask）だけから近い順に k 件。同距離はレイヤーの登録順
+        if not known.count: return []  # 何も知らなければビット走査もしない
+        idx = np.flatnonzero(known.arr)
+        keys, pts = self._node_layer(known.index)
+        d = np.abs(pts[idx, 0] - pos[0]) + np.abs(pts[idx, 1] - pos[1])
+        if k == 1: return [keys[idx[int(d.argmin())]]]
+        return [keys[idx[j]] for j in np.argsort(d, kind="stable")[:k]]
     def nearest_nodes(self, pos, node_dict, k=4):
-        nodes = list(node_dict.keys())
-        if not nodes: return []
-        nodes.sort(key=lambda p: abs(p[0] - pos[0]) + abs(p[1] - pos[1]))
-        return nodes[:k]
+        if not node_dict: return []
+        px, py = pos
+        if id(node_dict) not in self._node_layers:
+            return heapq.nsmallest(k, node_dict, key=lambda p: abs(p[0] - px) + abs(p[1] - py))
+        ck = (pos, id(node_dict), k)
+        hit = self._nearest_cache.get(ck)
+        if hit is not None and len(self._node_layers[id(node_dict)][0]) == len(node_dict): return list(hit)
+        keys, pts = self._node_layer(node_dict)
+        d = np.abs(pts[:, 0] - px) + np.abs(pts[:, 1] - py)
+        if k == 1: res = (keys[int(d.argmin())],)
+        elif k >= len(keys): res = tuple(keys[i] for i in np.argsort(d, kind="stable"))
+        else:
+            # argpartition で k 番目の距離だけ求め、それ以下の候補だけを安定ソート（同距離は登録順）
+            kth = d[np.argpartition(d, k - 1)[k - 1]]
+            cand = np.flatnonzero(d <= kth)
+            res = tuple(keys[i] for i in cand[np.argsort(d[cand], kind="stable")[:k]])
+        self._nearest_cache[ck] = res
+        return list(res)
         
     def forage(self, pos, node):
-        abundance = self.berries[node]["abundance"]
-        dist = abs(pos[0] - node[0]) + abs(pos[1] - node[1])
-        p = 0.6 * abundance + 0.25 * max(0, 1 - dist / 12)
-        modifier = self.day_night.get_forage_success_modifier()
-        p *= modifier
-
-        # 雨が強いと採集成功率が下がる (from pasted_content.txt)
-        if self.weather.condition == "rainy":
-            p *= (1.0 - 0.5 * self.weather.intensity)
-
+        ab = self._berry_abundance; i = self.berries[node]
+        abundance = float(ab[i])
+        (px, py), (nx, ny) = pos, node
+        p = forage_prob(abundance, abs(px - nx) + abs(py - ny), self._forage_light, self._forage_rain)
         success = random.random() < p
         if success:
-            self.berries[node]["abundance"] = max(0.0, self.berries[node]["abundance"] - random.uniform(0.2, 0.4))
+            ab[i] = max(0.0, abundance - random.uniform(0.2, 0.4))
             food = random.uniform(14, 26) * (0.6 + abundance / 2)
         else:
             food = 0.0
@@ -244,19 +356,81 @@ class Territory:
         self.intrusion_tolerance = 0.5
         self.memory = {"food_found":0, "helped_here":0, "threatened":0, "rested":0}
         self.attachment_strength = 0.3
+    @property
+    def radius(self): return self._radius
+    @radius.setter
+    def radius(self, r): self._radius = r; self._r2 = r * r  # contains 用に r² を保持
     def contains(self, pos):
-        dx = pos[0] - self.center[0]; dy = pos[1] - self.center[1]
-        return (dx**2 + dy**2) <= self.radius**2
+        cx, cy = self.center
+        dx = pos[0] - cx; dy = pos[1] - cy
+        return dx*dx + dy*dy <= self._r2
+
+class KnowledgeMask:
+    """資源レイヤー1つ分の既知フラグ（uint8 ビット列）。node -> 行番号はレイヤー dict が持つ。set と同じ使い方ができる"""
+    __slots__ = ("index", "keys", "bits", "arr", "count")
+    def __init__(self, layer):
+        self.index = layer; self.keys = tuple(layer)
+        self.bits = bytearray(len(layer))                  # スカラー参照は bytearray で速く
+        self.arr = np.frombuffer(self.bits, dtype=np.uint8)  # 同じメモリの配列ビュー（一括演算用）
+        self.count = 0
+    def add(self, node):
+        i = self.index[node]
+        if not self.bits[i]: self.bits[i] = 1; self.count += 1
+    def __contains__(self, node):
+        i = self.index.get(node)
+        return i is not None and self.bits[i] == 1
+    def __len__(self): return self.count
+    def __iter__(self): return (self.keys[i] for i in np.flatnonzero(self.arr))
+    def merge(self, other):
+        # other の既知をまとめて取り込む。新しく増えたら True
+        if not (other.arr > self.arr).any(): return False
+        np.bitwise_or(self.arr, other.arr, out=self.arr); self.count = int(self.arr.sum())
+        return True
+
+# 8近傍 + 停止（ランダムウォーク用。randint(0, 8) 1回で1歩を決める）
+_DIRS8 = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 0), (0, 1), (1, -1), (1, 0), (1, 1))
+
+# リソースタイプに応じた発見価値の設定
+RESOURCE_VALUES = {
+    "cave": 0.9,           # 安全な避難場所として高価値
+    "water": 0.8,          # 生存に必須
+    "berry_patch": 1.0,    # 食料確保で最高価値
+    "hunting_ground": 0.85  # タンパク質源として高価値
+}
+
+def exploration_pressure(ticks_since_discovery, n_cave, total_cave, n_water, total_water,
+                         n_berry, total_berry, n_hunt, total_hunt, informs_allies):
+    """探索圧力 — 既知数/総数だけから決まる純粋なスカラー計算（上限 2.5）"""
+    boredom = min(1.0, ticks_since_discovery / 150.0)
+    pressure = boredom * 0.6
+    # 全リソースタイプの未発見状況を考慮した探索圧力
+    total_unknown_pressure = 0.0
+    if n_cave < total_cave: total_unknown_pressure += (1.0 - n_cave / total_cave) * 0.25      # 洞窟
+    if n_water < total_water: total_unknown_pressure += (1.0 - n_water / total_water) * 0.25  # 水源
+    if n_berry < total_berry: total_unknown_pressure += (1.0 - n_berry / total_berry) * 0.3   # ベリー（食料は重要なので重み大）
+    if n_hunt < total_hunt: total_unknown_pressure += (1.0 - n_hunt / total_hunt) * 0.2       # 狩場
+    pressure += total_unknown_pressure
+    if informs_allies: pressure += 0.4
+    return min(2.5, pressure)  # 最大値も少し上げる
 
 class NPCPriority:
+    ACTION_INDEX = {"hunt": 0, "exploration": 1, "social": 2}
     def __init__(self, name, preset, env, roster_ref, start_pos,
                  horizon=8, horizon_rally=6, rally_ttl=10):
         self.name = name; self.env = env; self.roster_ref = roster_ref
         self.x, self.y = start_pos
+        self._env_max = env.size - 1  # move_towards のクランプ上限
+        # 資源ノード数は生成後に変わらない（探索圧力の分母）
+        self._env_n_caves = len(env.caves); self._env_n_water = len(env.water_sources)
+        self._env_n_berries = len(env.berries); self._env_n_hunt = len(env.huntzones)
         self.hunger = 50.0; self.thirst = 20.0; self.fatigue = 30.0; self.injury = 0.0
         self.water = 15.0  # 初期水分量を増加 
         self.alive = True; self.state = "Awake"
-        self.kappa = defaultdict(lambda: 0.1); self.kappa_min = 0.05
+        self.rid = env.register_npc(self)
+        self._allies_cache = {}; self._allies_ver = -1  # radius -> 近隣リスト（誰も動かない間は再利用）
+        # kappa: 行動ごとの整合慣性（未経験は 0.1）。kappa_seen は一度でも触れた行動
+        self.kappa_arr = np.full(len(self.ACTION_INDEX), 0.1); self.kappa_min = 0.05
+        self.kappa_seen = np.zeros(len(self.ACTION_INDEX), dtype=bool)
         self.E = 0.0; self.T = 0.3
         self.G0 = 0.5; self.g = 0.7; self.eta = 0.3
         self.lambda_forget = 0.02; self.rho = 0.1; self.alpha = 0.6; self.beta_E = 0.15
@@ -266,7 +440,6 @@ class NPCPriority:
         self.risk_tolerance = p["risk_tolerance"]; self.curiosity = p["curiosity"]
         self.avoidance = p["avoidance"]; self.stamina = p["stamina"]; self.empathy = p.get("empathy",0.6)
         self.TH_H = 55.0; self.TH_T = 60.0 
-        self.rel = defaultdict(float); self.help_debt = defaultdict(float)
         self.sleep_debt = 0.0; self.is_sleeping = False; self.sleep_duration = 0
         self.total_sleep_time = 0; self.sleep_cycles = 0
         initial_radius = 5 + self.avoidance * 3
@@ -275,7 +448,6 @@ class NPCPriority:
         self.group_loyalty = 0.5 + self.empathy * 0.3
         self.detected_intruders = []
         self.invited_guests = set()
-        self.log = []
         
         # 【修正1】rally_targetの初期化
         self.rally_target = None
@@ -293,8 +465,9 @@ class NPCPriority:
         self.align_decay   = 0.004
         self.rally_state = { "leader": None, "ttl": 0, "node": None, "min_k": 2, "kind": "hunt"}
         self.combat_power_base = 2.0 + (self.risk_tolerance * 2.0) + (self.stamina * 1.0)
+        self._refresh_cp_k()
         self.combat_xp = 0.0
-        self.knowledge_water = set()
+        self.knowledge_water = KnowledgeMask(self.env.water_sources)
         # 最も近い水源を1つだけ知っている状態でスタート
         initial_waters = self.env.nearest_nodes(self.pos(), self.env.water_sources, k=1)
         for water in initial_waters:
@@ -311,10 +484,18 @@ class NPCPriority:
         self.last_discovery_tick = 0
 
         # 知識管理を拡張：各種リソースの発見状況を管理
-        self.knowledge_caves = set()
-        self.knowledge_berries = set()  # ベリー採取場所の知識
-        self.knowledge_huntzones = set()  # 狩場の知識
+        self.knowledge_caves = KnowledgeMask(self.env.caves)
+        self.knowledge_berries = KnowledgeMask(self.env.berries)  # ベリー採取場所の知識
+        self.knowledge_huntzones = KnowledgeMask(self.env.huntzones)  # 狩場の知識
         
+        # scout_action 用（並びは env.nearest_of_each と同じ）
+        self._resource_types = (
+            ("cave", self.knowledge_caves),
+            ("water", self.knowledge_water),
+            ("berry_patch", self.knowledge_berries),
+            ("hunting_ground", self.knowledge_huntzones)
+        )
+
         # 初期知識を大幅に削減：最低限のリソースのみ知っている状態
         # 洞窟は1つだけ知っている
         initial_cave = self.env.nearest_nodes(self.pos(), self.env.caves, k=1)
@@ -346,14 +527,16 @@ class NPCPriority:
     def decay_alignment_inertia(self):
         self.align_inertia = max(0.0, self.align_inertia - self.align_decay)
 
+    def _refresh_cp_k(self):
+        # combat_power の不変部分（base × hunt の kappa 項）。kappa_arr が変わったら呼ぶ
+        self._cp_k = self.combat_power_base * (1.0 + 0.25*float(self.kappa_arr[0]))
     def combat_power(self, group_bonus=0.0):
-        k = self.kappa.get("hunt", 0.1)
-        xp_term = 1.0 + 0.15*np.tanh(self.combat_xp/30.0)
+        xp_term = 1.0 + 0.15*math.tanh(self.combat_xp/30.0)
         fatigue_pen = 1.0 - 0.35*(self.fatigue/120.0)
         injury_pen  = 1.0 - 0.50*(self.injury /120.0)
         inertia_boost = 1.0 + 0.25*self.align_inertia
         return max(0.1,
-                   (self.combat_power_base * (1.0 + 0.25*k) * xp_term * fatigue_pen * injury_pen * inertia_boost)
+                   (self._cp_k * xp_term * fatigue_pen * injury_pen * inertia_boost)
                    * (1.0 + group_bonus)
         )
 
@@ -361,21 +544,42 @@ class NPCPriority:
         self.combat_xp += amount
 
     def pos(self): return (self.x, self.y)
-    def dist_to(self, o): return abs(self.x - o.x) + abs(self.y - o.y)
-    def dist_to_pos(self, pos): return abs(self.x - pos[0]) + abs(self.y - pos[1])  # タプル座標との距離計算
+    def dist_to(self, o):
+        dx = self.x - o.x; dy = self.y - o.y  # abs() 呼び出しを避けて分岐で符号反転
+        return (-dx if dx < 0 else dx) + (-dy if dy < 0 else dy)
+    def dist_to_pos(self, pos):  # タプル座標との距離計算
+        dx = self.x - pos[0]; dy = self.y - pos[1]
+        return (-dx if dx < 0 else dx) + (-dy if dy < 0 else dy)
     def move_towards(self, target):
         # 【修正3】境界チェックの追加
-        tx, ty = target
-        self.x += (1 if tx > self.x else -1 if tx < self.x else 0)
-        self.y += (1 if ty > self.y else -1 if ty < self.y else 0)
-        self.x = max(0, min(self.env.size - 1, self.x))
-        self.y = max(0, min(self.env.size - 1, self.y))
-    def nearby_allies(self, radius=3): return [o for on, o in self.roster_ref.items() if on != self.name and o.alive and self.dist_to(o) <= radius]
-    def alignment_flow(self, action_type, meaning_pressure): return (self.G0 + self.g * self.kappa[action_type]) * meaning_pressure
+        tx, ty = target; x, y = self.x, self.y; m = self._env_max
+        x += (tx > x) - (tx < x); y += (ty > y) - (ty < y)
+        self.x = 0 if x < 0 else m if x > m else x
+        self.y = 0 if y < 0 else m if y > m else y
+        self.env._npc_xy[self.rid] = self.x, self.y; self.env._npc_ver += 1
+    def sync_pos(self): self.env._npc_xy[self.rid] = self.x, self.y; self.env._npc_ver += 1
+    def nearby_allies(self, radius=3):
+        env = self.env
+        if self._allies_ver != env._npc_ver:
+            self._allies_cache.clear(); self._allies_ver = env._npc_ver
+        hit = self._allies_cache.get(radius)
+        if hit is None:
+            if radius >= 2 * self._env_max: near = env._npc_alive.copy()  # マップ全域を覆う半径は距離計算不要
+            else:
+                xy = env._npc_xy
+                near = env._npc_alive & (np.abs(xy[:, 0] - self.x) + np.abs(xy[:, 1] - self.y) <= radius)
+            near[self.rid] = False
+            hit = self._allies_cache[radius] = [env._npcs[i] for i in np.flatnonzero(near)]
+        return list(hit)
+    def alignment_flow(self, action_type, meaning_pressure):
+        idx = self.ACTION_INDEX[action_type]; self.kappa_seen[idx] = True
+        return (self.G0 + self.g * float(self.kappa_arr[idx])) * meaning_pressure
     def update_kappa(self, action_type, success, reward):
-        kappa = self.kappa[action_type]
+        idx = self.ACTION_INDEX[action_type]; self.kappa_seen[idx] = True
+        kappa = float(self.kappa_arr[idx])
         work = self.eta * reward if success else -self.rho * (kappa ** 2)
-        self.kappa[action_type] = max(self.kappa_min, kappa + work - (self.lambda_forget * (kappa - self.kappa_min)))
+        self.kappa_arr[idx] = max(self.kappa_min, kappa + work - (self.lambda_forget * (kappa - self.kappa_min)))
+        if idx == 0: self._refresh_cp_k()
     def update_heat(self, meaning_pressure, processed_amount):
         unprocessed = max(0, meaning_pressure - processed_amount)
         self.E = max(0, self.E + self.alpha * unprocessed - self.beta_E * self.E)
@@ -393,12 +597,12 @@ class NPCPriority:
         return False
     def enter_sleep(self, t): self.is_sleeping = True; self.sleep_duration = 0; self.state = "Sleeping"; self.sleep_cycles += 1
     def consolidate_memory(self):
-        if len(self.kappa) < 2: return
-        actions, values = list(self.kappa.keys()), list(self.kappa.values())
-        mean_kappa = np.mean(values)
-        for action in actions:
-            if self.kappa[action] > mean_kappa: self.kappa[action] = min(1.0, self.kappa[action] + 0.05)
-            else: self.kappa[action] = max(self.kappa_min, self.kappa[action] - self.lambda_forget * 3)
+        seen, k = self.kappa_seen, self.kappa_arr
+        values = [v for v, f in zip(k.tolist(), seen.tolist()) if f]  # 要素は高々数個なので平均は Python で
+        if len(values) < 2: return
+        up = k > sum(values) / len(values)
+        consolidated = np.where(up, np.minimum(1.0, k + 0.05), np.maximum(self.kappa_min, k - self.lambda_forget * 3))
+        self.kappa_arr = np.where(seen, consolidated, k); self._refresh_cp_k()
     def wake_up(self, t, reason):
         self.is_sleeping = False; self.state = "Awake"
         if reason == "natural": self.T = self.T0; self.boredom = 0.0
@@ -407,15 +611,19 @@ class NPCPriority:
         cx, cy = self.territory.center
         self.territory.center = (cx * 0.95 + self.x * 0.05, cy * 0.95 + self.y * 0.05)
     def detect_intruders(self, t):
+        allies = self.nearby_allies(radius=int(self.territory.radius))
+        if not allies:  # 縄張り内に誰もいなければ空リストを使い回す
+            if self.detected_intruders: self.detected_intruders = []
+            return
         self.detected_intruders = []
-        for ally in self.nearby_allies(radius=int(self.territory.radius)):
+        for ally in allies:
             if ally.name in self.invited_guests: continue
             if self.territory.contains(ally.pos()):
                 self.detected_intruders.append({"npc": ally, "threat_level": self.calculate_threat(ally)})
     def calculate_threat(self, other):
         threat = 0.3 + other.territorial_aggression * 0.3
-        if self.rel[other.name] < 0: threat += abs(self.rel[other.name]) * 0.5
-        elif self.rel[other.name] > 0.5: threat -= 0.3
+        if self.rel[other.rid] < 0: threat += abs(self.rel[other.rid]) * 0.5
+        elif self.rel[other.rid] > 0.5: threat -= 0.3
         if self.hunger > 70 and other.hunger > 70: threat += 0.4
         return max(0, min(1.0, threat))
     def react_to_intruder(self, intruder, t):
@@ -435,13 +643,13 @@ class NPCPriority:
                 escape_x = self.territory.center[0] + (self.x - predator.x)
                 escape_y = self.territory.center[1] + (self.y - predator.y)
                 self.move_towards((escape_x, escape_y))
-                self.log.append({"t": t, "name": self.name, "action": "flee_predator"})
+                self.env.log_event(t, self.name, "flee_predator")
                 return "fled"
         return None
 
     def emit_rally_predator(self, t, predator_node=None, min_k=2, ttl=10):
         self.rally_state = {"leader": self.name, "ttl": ttl, "node": predator_node, "min_k": min_k, "kind": "predator"}
-        self.log.append({"t": t, "name": self.name, "action": "rally_for_predator"})
+        self.env.log_event(t, self.name, "rally_for_predator")
 
     def attempt_predator_hunt(self, t, predator):
         rs = self.rally_state
@@ -459,14 +667,14 @@ class NPCPriority:
                 m.gain_combat_xp(5.0 + 2.0*predator.strength)
                 m.update_kappa("hunt", True, 1.0)
                 m.update_alignment_inertia("predator", 1.0, 1.0, True)
-            self.log.append({"t": t, "name": self.name, "action": "predator_slay_success", "party": [m.name for m in party]})
+            self.env.log_event(t, self.name, "predator_slay_success", {"party": [m.name for m in party]})
         else:
             for m in party:
                 m.injury = min(120, m.injury + random.uniform(5, 15))
                 m.gain_combat_xp(2.0 + 1.0*predator.strength)
                 m.update_kappa("hunt", False, 0)
                 m.update_alignment_inertia("predator", 1.0, 0.0, False)
-            self.log.append({"t": t, "name": self.name, "action": "predator_slay_failure", "party": [m.name for m in party]})
+            self.env.log_event(t, self.name, "predator_slay_failure", {"party": [m.name for m in party]})
         for m in party:
             if getattr(m, "rally_target", None) == self.name: m.rally_target = None; m.state = "Awake"
         self.rally_state = {"leader": None, "ttl": 0, "node": None, "min_k": 2, "kind": "hunt"}
@@ -474,7 +682,7 @@ class NPCPriority:
 
     def emit_rally_for_hunt(self, t, hunt_node=None, min_k=2, ttl=10):
         self.rally_state = {"leader": self.name, "ttl": ttl, "node": hunt_node, "min_k": min_k, "kind": "hunt"}
-        self.log.append({"t": t, "name": self.name, "action": "rally_for_hunt"})
+        self.env.log_event(t, self.name, "rally_for_hunt")
 
     def consider_join_rally(self, t):
         for ally in self.nearby_allies(radius=8):
@@ -484,11 +692,11 @@ class NPCPriority:
                 threat_bonus = 0.35 if rally_kind == "predator" else 0.0
                 need_pressure = max(0.0, (self.hunger - self.TH_H) / (100 - self.TH_H))
                 base = self.alignment_flow("hunt", need_pressure)
-                u = base + 0.70 + threat_bonus + 0.35 * self.rel[ally.name] - 0.008 * self.fatigue + 0.4 * self.cohesion + 0.4 * self.village_affinity
+                u = base + 0.70 + threat_bonus + 0.35 * self.rel[ally.rid] - 0.008 * self.fatigue + 0.4 * self.cohesion + 0.4 * self.village_affinity
                 if u >= 0.0 and not self.is_sleeping:
                     target = rs["node"] if rs["node"] else ally.pos()
                     self.move_towards(target); self.state = "rallying"; self.rally_target = ally.name
-                    self.log.append({"t": t, "name": self.name, "action": "join_rally", "leader": ally.name})
+                    self.env.log_event(t, self.name, "join_rally", {"leader": ally.name})
                     return True
         return False
 
@@ -508,99 +716,64 @@ class NPCPriority:
                 before = m.hunger; m.hunger = max(0.0, m.hunger - share)
                 rem = max(0.0, share - (before - m.hunger)); m.food_store = min(m.max_store, m.food_store + rem * 0.6)
                 m.update_kappa("hunt", True, share)
-                meaning_p = max(0.0, (m.hunger - m.TH_H) / (100 - m.TH_H)); processed = min(1.0, 0.6 + 0.4*np.tanh(share/60.0))
+                meaning_p = max(0.0, (m.hunger - m.TH_H) / (100 - m.TH_H)); processed = min(1.0, 0.6 + 0.4*math.tanh(share/60.0))
                 m.update_alignment_inertia("hunt", meaning_p, processed, True)
             else:
                 m.update_kappa("hunt", False, 0)
                 meaning_p = max(0.0, (self.hunger - self.TH_H) / (100 - self.TH_H))
                 m.update_alignment_inertia("hunt", meaning_p, 0.0, False)
             if getattr(m, "rally_target", None) == self.name: m.rally_target = None; m.state = "Awake"
-        self.log.append({"t": t, "name": self.name, "action": "rally_group_hunt_success" if success else "rally_group_hunt_failure", "party": [m.name for m in party]})
+        self.env.log_event(t, self.name, "rally_group_hunt_success" if success else "rally_group_hunt_failure", {"party": [m.name for m in party]})
         self.rally_state = {"leader": None, "ttl": 0, "node": None, "min_k": 2, "kind": "hunt"}
         return True
 
     def mark_social(self, t): self.last_social_tick = t
     def apply_triadic_closure(self):
-        for i, a in enumerate(self.nearby_allies(radius=4)):
-            for b in self.nearby_allies(radius=4)[i+1:]:
-                if self.rel[a.name] > 0.2 and self.rel[b.name] > 0.2:
-                    inc = 0.03 * min(self.rel[a.name], self.rel[b.name])
-                    a.rel[b.name] = max(-0.5, min(1.0, a.rel.get(b.name, 0) + inc))
-                    b.rel[a.name] = max(-0.5, min(1.0, b.rel.get(a.name, 0) + inc))
+        allies = self.nearby_allies(radius=4)
+        for i, a in enumerate(allies):
+            for b in allies[i+1:]:
+                if self.rel[a.rid] > 0.2 and self.rel[b.rid] > 0.2:
+                    inc = 0.03 * min(self.rel[a.rid], self.rel[b.rid])
+                    a.rel[b.rid] = max(-0.5, min(1.0, a.rel[b.rid] + inc))
+                    b.rel[a.rid] = max(-0.5, min(1.0, b.rel[a.rid] + inc))
     def copresence_tick(self):
         for o in self.nearby_allies(radius=3):
-            if self.rel[o.name] > 0: self.rel[o.name] = min(1.0, self.rel[o.name] + 0.015)
+            if self.rel[o.rid] > 0: self.rel[o.rid] = min(1.0, self.rel[o.rid] + 0.015)
     def social_gravity_move(self):
         cands = self.nearby_allies(radius=6)
         if not cands: return False
-        best = max(cands, key=lambda o: self.rel[o.name])
+        best = max(cands, key=lambda o: self.rel[o.rid])
         if random.random() < 0.25: self.move_towards(best.pos()); return True
         return False
 
     # --- pasted_content.txtからの追加メソッド ---
     def calculate_exploration_pressure(self):
-        pressure = 0.0
-        ticks_since_discovery = self.env.t - self.last_discovery_tick
-        boredom = min(1.0, ticks_since_discovery / 150.0)
-        pressure += boredom * 0.6
-        
-        # 全リソースタイプの未発見状況を考慮した探索圧力
-        total_unknown_pressure = 0.0
-        
-        # 洞窟の未発見圧力
-        if len(self.knowledge_caves) < len(self.env.caves):
-            cave_ratio = 1.0 - len(self.knowledge_caves) / len(self.env.caves)
-            total_unknown_pressure += cave_ratio * 0.25
-            
-        # 水源の未発見圧力
-        if len(self.knowledge_water) < len(self.env.water_sources):
-            water_ratio = 1.0 - len(self.knowledge_water) / len(self.env.water_sources)
-            total_unknown_pressure += water_ratio * 0.25
-            
-        # ベリー採取場所の未発見圧力
-        if len(self.knowledge_berries) < len(self.env.berries):
-            berry_ratio = 1.0 - len(self.knowledge_berries) / len(self.env.berries)
-            total_unknown_pressure += berry_ratio * 0.3  # 食料は重要なので重み大
-            
-        # 狩場の未発見圧力
-        if len(self.knowledge_huntzones) < len(self.env.huntzones):
-            hunt_ratio = 1.0 - len(self.knowledge_huntzones) / len(self.env.huntzones)
-            total_unknown_pressure += hunt_ratio * 0.2
-            
-        pressure += total_unknown_pressure
-        
         # スカウト役の場合は仲間への情報提供責任も圧力となる
+        allies_needing_info = 0
         if self.role == "scout":
-            allies_needing_info = 0
             for ally in self.nearby_allies(radius=100):
                 if (len(ally.knowledge_caves) < len(self.knowledge_caves) or
                     len(ally.knowledge_berries) < len(self.knowledge_berries) or
                     len(ally.knowledge_huntzones) < len(self.knowledge_huntzones)):
                     allies_needing_info += 1
-            if allies_needing_info > 0: pressure += 0.4
-            
-        return min(2.5, pressure)  # 最大値も少し上げる
+        return exploration_pressure(self.env.t - self.last_discovery_tick,
+                                    len(self.knowledge_caves), self._env_n_caves,
+                                    len(self.knowledge_water), self._env_n_water,
+                                    len(self.knowledge_berries), self._env_n_berries,
+                                    len(self.knowledge_huntzones), self._env_n_hunt,
+                                    allies_needing_info > 0)
 
     def experience_discovery_pleasure(self, t, resource_type, node):
         meaning_pressure = self.calculate_exploration_pressure()
-        
-        # リソースタイプに応じた発見価値の設定
-        resource_values = {
-            "cave": 0.9,           # 安全な避難場所として高価値
-            "water": 0.8,          # 生存に必須
-            "berry_patch": 1.0,    # 食料確保で最高価値
-            "hunting_ground": 0.85  # タンパク質源として高価値
-        }
-        
-        value = resource_values.get(resource_type, 0.7)
+        value = RESOURCE_VALUES.get(resource_type, 0.7)
         pleasure = meaning_pressure * value * 1.0 * self.discovery_reward_multiplier
         
-        self.kappa["exploration"] = min(1.0, self.kappa.get("exploration", 0.1) + 0.15)
+        self.kappa_seen[1] = True; self.kappa_arr[1] = min(1.0, float(self.kappa_arr[1]) + 0.15)  # exploration
         self.E = min(5.0, self.E + pleasure * 0.5)
         self.T = max(self.T0, self.T - 0.3)
         self.last_discovery_tick = t
         
-        self.log.append({"t": t, "name": self.name, "action": f"discovery_pleasure_{resource_type}", "pleasure": pleasure})
+        self.env.log_event(t, self.name, f"discovery_pleasure_{resource_type}", {"pleasure": pleasure})
         return pleasure
 
     def consider_becoming_scout(self, t):
@@ -617,20 +790,22 @@ class NPCPriority:
         # 時間経過による自動転職促進
         if t > 30 and exploration_pressure > 0.2: pass
         elif t > 100: pass  # 100tick後は無条件で転職可能
-        elif self.kappa.get("exploration", 0.0) >= 0.1: pass  # わずかな探索経験があれば
+        elif self.kappa_seen[1] and self.kappa_arr[1] >= 0.1: pass  # わずかな探索経験があれば
         else: return False
 
         self.role = "scout"
         self.discovery_reward_multiplier = 2.0
-        self.log.append({"t": t, "name": self.name, "action": "role_transition_to_scout"})
+        self.env.log_event(t, self.name, "role_transition_to_scout")
         return True
 
     def share_discovery_with_pleasure(self, t, node, resource_type):
         shared_count = 0; total_approval = 0.0
-        for ally in self.nearby_allies(radius=8):
-            relationship = self.rel.get(ally.name, 0)
-            sharing_probability = 0.3 + 0.7 * relationship
-            if random.random() > sharing_probability: continue
+        allies = self.nearby_allies(radius=8)
+        if not allies: return
+        rids = [a.rid for a in allies]
+        accepts = (np.random.random(len(rids)) <= 0.3 + 0.7 * self.rel[rids]).tolist()  # 乱数は一括で引く
+        for ally, accepted in zip(allies, accepts):
+            if not accepted: continue
             
             # リソースタイプに応じて適切な知識セットを選択
             if resource_type == "cave":
@@ -648,69 +823,60 @@ class NPCPriority:
                 target_knowledge.add(node)
                 # 新しいリソース情報は特に価値が高いので関係性ボーナスを増加
                 relationship_bonus = 0.4 if resource_type in ["berry_patch", "hunting_ground"] else 0.3
-                ally.rel[self.name] = min(1.0, ally.rel.get(self.name, 0) + relationship_bonus)
-                self.rel[ally.name] = min(1.0, self.rel.get(ally.name, 0) + 0.1)
+                ally.rel[self.rid] = min(1.0, ally.rel[self.rid] + relationship_bonus)
+                self.rel[ally.rid] = min(1.0, self.rel[ally.rid] + 0.1)
                 
-                total_approval += ally.rel[self.name]
+                total_approval += float(ally.rel[self.rid])
                 shared_count += 1
-                self.log.append({"t": t, "name": self.name, "action": f"share_{resource_type}_info", "target": ally.name})
+                self.env.log_event(t, self.name, f"share_{resource_type}_info", {"target": ally.name})
         
         if shared_count > 0:
             base_pleasure = 0.3 * shared_count
             approval_multiplier = 1.0 + (total_approval / shared_count) * 0.5
             cooperation_bonus = 1.2 if shared_count >= 2 else 1.0
             total_pleasure = base_pleasure * approval_multiplier * cooperation_bonus
-            self.kappa["social"] = min(1.0, self.kappa.get("social", 0.1) + 0.05 * shared_count)
-            self.log.append({"t": t, "name": self.name, "action": "approval_pleasure", "pleasure": total_pleasure})
+            self.kappa_seen[2] = True; self.kappa_arr[2] = min(1.0, float(self.kappa_arr[2]) + 0.05 * shared_count)  # social
+            self.env.log_event(t, self.name, "approval_pleasure", {"pleasure": total_pleasure})
 
     def scout_action(self, t):
         exploration_pressure = self.calculate_exploration_pressure()
         if exploration_pressure < 0.3: return False  # 閾値を下げて積極的に探索
-        self.log.append({"t": t, "name": self.name, "action": "scouting"})
+        self.env.log_event(t, self.name, "scouting")
         # Ensure movement stays within bounds
-        new_x = self.x + random.choice([-1, 0, 1])
-        new_y = self.y + random.choice([-1, 0, 1])
+        dx, dy = _DIRS8[random.randint(0, 8)]
+        new_x, new_y = self.x + dx, self.y + dy
         self.x = max(0, min(self.env.size - 1, new_x))
         self.y = max(0, min(self.env.size - 1, new_y))
+        self.sync_pos()
 
         # 全てのリソースタイプで新しい発見をチェック
-        resource_types = [
-            ("cave", self.env.caves, self.knowledge_caves),
-            ("water", self.env.water_sources, self.knowledge_water),
-            ("berry_patch", self.env.berries, self.knowledge_berries),
-            ("hunting_ground", self.env.huntzones, self.knowledge_huntzones)
-        ]
-        
-        for res_type, res_dict, knowledge in resource_types:
-            nearest = self.env.nearest_nodes(self.pos(), res_dict, k=1)
-            if nearest:
-                distance = self.dist_to_pos(nearest[0])
-                already_known = nearest[0] in knowledge
+        for (res_type, knowledge), (node, distance) in zip(self._resource_types, self.env.nearest_of_each(self.pos())):
+            if node is not None:
+                already_known = node in knowledge
                 # デバッグ情報をログに追加
-                self.log.append({"t": t, "name": self.name, "action": f"scout_check_{res_type}", 
-                               "distance": distance, "already_known": already_known, "pos": self.pos()})
+                self.env.log_event(t, self.name, f"scout_check_{res_type}", 
+                                   {"distance": distance, "already_known": already_known, "pos": self.pos()})
                 
                 if distance <= 2 and not already_known:
-                    knowledge.add(nearest[0])
-                    self.experience_discovery_pleasure(t, res_type, nearest[0])
-                    self.share_discovery_with_pleasure(t, nearest[0], res_type)
+                    knowledge.add(node)
+                    self.experience_discovery_pleasure(t, res_type, node)
+                    self.share_discovery_with_pleasure(t, node, res_type)
                     # 特別な発見ログを追加
-                    self.log.append({"t": t, "name": self.name, "action": f"discover_{res_type}", "location": nearest[0]})
+                    self.env.log_event(t, self.name, f"discover_{res_type}", {"location": node})
         return True
 
     def share_water_knowledge(self, t):
         if not self.knowledge_water: return
-        for ally in self.nearby_allies(radius=8):
-            if random.random() < (0.3 + 0.7 * self.rel.get(ally.name, 0)):
-                new_knowledge_shared = False
-                for water_node in self.knowledge_water:
-                    if water_node not in ally.knowledge_water:
-                        ally.knowledge_water.add(water_node)
-                        new_knowledge_shared = True
-                if new_knowledge_shared:
-                    self.log.append({"t": t, "name": self.name, "action": "share_water_info", "target": ally.name})
-                    ally.rel[self.name] = min(1.0, ally.rel.get(self.name, 0) + 0.1)
-                    self.rel[ally.name] = min(1.0, self.rel.get(ally.name, 0) + 0.05)
+        allies = self.nearby_allies(radius=8)
+        if not allies: return
+        rids = [a.rid for a in allies]
+        accepts = (np.random.random(len(rids)) < 0.3 + 0.7 * self.rel[rids]).tolist()  # 乱数は一括で引く
+        for ally, accepted in zip(allies, accepts):
+            if accepted:
+                if ally.knowledge_water.merge(self.knowledge_water):
+                    self.env.log_event(t, self.name, "share_water_info", {"target": ally.name})
+                    ally.rel[self.rid] = min(1.0, ally.rel[self.rid] + 0.1)
+                    self.rel[ally.rid] = min(1.0, self.rel[ally.rid] + 0.05)
 
     def forecast_hunger(self, t, ticks_ahead):
         # 簡易的な将来の空腹度予測
@@ -719,55 +885,58 @@ class NPCPriority:
     def maybe_help_territorial(self, t, predator):
         # 縄張り防衛の支援ロジック
         for ally in self.nearby_allies(radius=8):
-            if ally.detected_intruders and self.rel[ally.name] > 0.4 and random.random() < self.empathy:
+            if ally.detected_intruders and self.rel[ally.rid] > 0.4 and random.random() < self.empathy:
                 # 侵入者への対応を支援
                 intruder = ally.detected_intruders[0]
                 if ally.territorial_aggression > self.territorial_aggression:
                     # リーダーが攻撃的なら一緒に追い払う
                     self.move_towards(intruder["npc"].pos())
-                    self.log.append({"t": t, "name": self.name, "action": "assist_territorial_defense", "target": ally.name})
+                    self.env.log_event(t, self.name, "assist_territorial_defense", {"target": ally.name})
                     return True
                 elif ally.territorial_aggression < self.territorial_aggression and intruder["threat_level"] < 0.5:
                     # リーダーが非攻撃的で脅威が低いなら、仲裁を試みる
-                    self.log.append({"t": t, "name": self.name, "action": "mediate_territorial_dispute", "target": ally.name})
+                    self.env.log_event(t, self.name, "mediate_territorial_dispute", {"target": ally.name})
                     return True
         return False
     # --- pasted_content.txtからの追加メソッドここまで ---
 
     def step(self, t, predator=None):
         if not self.alive: return
+        # 環境の昼夜/天候はこの tick 中は不変なのでローカルに束縛
+        env = self.env; dn = env.day_night; weather = env.weather
+        cond, intensity = weather.condition, weather.intensity
 
         # === 状態更新フェーズ ===
         self.hunger += 1.0
-        self.fatigue += 1.0 * self.env.day_night.get_activity_cost_multiplier()
+        self.fatigue += 1.0 * dn.get_activity_cost_multiplier()
         self.sleep_debt += 0.8
 
         # --- 気候による意味圧を適用 ---
-        weather = self.env.weather
-        if weather.condition == 'sunny':
-            self.thirst += 1.5 + (1.0 * weather.intensity)
-        elif weather.condition == 'rainy':
+        if cond == 'sunny':
+            self.thirst += 1.5 + (1.0 * intensity)
+        elif cond == 'rainy':
             self.thirst += 0.5
-            self.fatigue += 1.5 * weather.intensity
-            if weather.intensity > 0.7 and random.random() < 0.05:
+            self.fatigue += 1.5 * intensity
+            if intensity > 0.7 and random.random() < 0.05:
                 self.injury = min(120, self.injury + random.uniform(1, 5))
-                self.log.append({"t": t, "name": self.name, "action": "injured_by_heavy_rain"})
+                env.log_event(t, self.name, "injured_by_heavy_rain")
 
         self.update_territory_center(); self.detect_intruders(t)
         if any(self.react_to_intruder(i, t) in ["chased", "retreated"] for i in self.detected_intruders): return
         
         if self.hunger >= 120 or self.injury >= 120 or self.thirst >= 120:
             cause = "hunger" if self.hunger >= 120 else "injury" if self.injury >= 120 else "thirst"
-            self.alive = False; self.log.append({"t": t, "name": self.name, "action": "death", "cause": cause})
+            self.alive = False; env._npc_alive[self.rid] = False; env._npc_ver += 1
+            env.log_event(t, self.name, "death", {"cause": cause})
             return
 
         if self.is_sleeping:
             self.sleep_duration += 1; self.total_sleep_time += 1
-            recovery = 6.0 * (1.5 if self.env.day_night.is_night() else 1.0)
+            recovery = 6.0 * (1.5 if dn.is_night() else 1.0)
             self.fatigue = max(0, self.fatigue - recovery); self.injury = max(0, self.injury - 2.0)
             self.sleep_debt = max(0, self.sleep_debt - 4.0)
             if self.sleep_duration > 5: self.consolidate_memory()
-            if self.fatigue < 30 and self.env.day_night.is_day(): self.wake_up(t, "natural")
+            if self.fatigue < 30 and dn.is_day(): self.wake_up(t, "natural")
             return
         
         # === 意思決定フェーズ ===
@@ -776,55 +945,56 @@ class NPCPriority:
 
         # L1: 緊急の生理的欲求
         # 強い雨の時は、安全な場所（縄張りの中心）へ避難しようとする
-        if weather.condition == 'rainy' and weather.intensity > 0.8 and self.dist_to_pos(self.territory.center) > 2:
+        if cond == 'rainy' and intensity > 0.8 and self.dist_to_pos(self.territory.center) > 2:
             self.move_towards(self.territory.center)
-            self.log.append({"t": t, "name": self.name, "action": "shelter_from_rain"})
+            env.log_event(t, self.name, "shelter_from_rain")
             return
 
         if self.thirst >= 95:
              if self.water > 0:
                 self.water -= 1.0; self.thirst = max(0, self.thirst - 60)
-                self.log.append({"t": t, "name": self.name, "action": "drink_carried_water"})
+                env.log_event(t, self.name, "drink_carried_water")
                 return
              else:
-                known_water = self.env.nearest_nodes(self.pos(), {k:v for k,v in self.env.water_sources.items() if k in self.knowledge_water}, k=1)
+                known_water = env.nearest_known(self.pos(), self.knowledge_water, k=1)
                 if known_water:
                     target = known_water[0]
                     if self.pos() == target: 
                         self.thirst = max(0, self.thirst - 80); self.water = 10.0
-                        self.log.append({"t": t, "name": self.name, "action": "drink_at_source", "node": target})
+                        env.log_event(t, self.name, "drink_at_source", {"node": target})
                     else: 
                         self.move_towards(target)
-                        self.log.append({"t": t, "name": self.name, "action": "move_to_water", "node": target})
+                        env.log_event(t, self.name, "move_to_water", {"node": target})
                     return
                 else:
                     # 水源探索ロジック (pasted_content.txtのNPCPriority.stepから)
-                    self.x += random.choice([-1, 0, 1]); self.y += random.choice([-1, 0, 1])
-                    self.x = max(0, min(self.env.size - 1, self.x))
-                    self.y = max(0, min(self.env.size - 1, self.y))
-                    self.log.append({"t": t, "name": self.name, "action": "explore_for_water"})
-                    found = self.env.nearest_nodes(self.pos(), self.env.water_sources, k=1)
-                    if found and self.dist_to(found[0]) <= 1:
+                    dx, dy = _DIRS8[random.randint(0, 8)]; self.x += dx; self.y += dy
+                    size_m1 = env.size - 1
+                    self.x = max(0, min(size_m1, self.x)); self.y = max(0, min(size_m1, self.y))
+                    self.sync_pos()
+                    env.log_event(t, self.name, "explore_for_water")
+                    found = env.nearest_nodes(self.pos(), env.water_sources, k=1)
+                    # 【修正5】水源ノードは座標タプルなので dist_to_pos（dist_to は NPC 用で AttributeError になっていた）
+                    if found and self.dist_to_pos(found[0]) <= 1:
                         self.knowledge_water.add(found[0])
-                        self.log.append({"t": t, "name": self.name, "action": "discover_water_source", "node": found[0]})
+                        env.log_event(t, self.name, "discover_water_source", {"node": found[0]})
                     return
 
         if self.hunger >= 95:
             # まず既知のベリー採取場所を優先的に探す
-            known_berries = {k: v for k, v in self.env.berries.items() if k in self.knowledge_berries}
-            if known_berries:
-                nodes = self.env.nearest_nodes(self.pos(), known_berries, k=1)
+            if self.knowledge_berries:
+                nodes = env.nearest_known(self.pos(), self.knowledge_berries, k=1)
             else:
                 # 既知の場所がない場合は近くを探索
-                nodes = self.env.nearest_nodes(self.pos(), self.env.berries, k=1)
+                nodes = env.nearest_nodes(self.pos(), env.berries, k=1)
                 # 新しい場所を発見した場合は知識に追加
                 if nodes and nodes[0] not in self.knowledge_berries:
                     self.knowledge_berries.add(nodes[0])
-                    self.log.append({"t": t, "name": self.name, "action": "discover_berry_patch", "location": nodes[0]})
+                    env.log_event(t, self.name, "discover_berry_patch", {"location": nodes[0]})
                     
             if nodes:
                 self.move_towards(nodes[0])
-                success, food, _, _ = self.env.forage(self.pos(), nodes[0])
+                success, food, _, _ = env.forage(self.pos(), nodes[0])
                 if success: self.hunger -= food
                 meaning_p = (self.hunger - self.TH_H) / 45.0; processed = food / 30.0 if success else 0
                 self.update_alignment_inertia("forage", meaning_p, processed, success)
@@ -908,28 +1078,19 @@ def run_sim(TICKS=400, predator_spawn_interval=80):
             if npc.name != other.name:
                 initial_distance = npc.dist_to(other)
                 if initial_distance < 5:
-                    npc.rel[other.name] = 0.3
+                    npc.rel[other.rid] = 0.3
     
     predator = Predator(env, strength=3.0)
     
-    logs = []
     weather_log = []
     for t in range(TICKS):
         if t > 0 and t % predator_spawn_interval == 0 and not predator.active:
             predator.spawn(t)
         predator.step()
         
-        current_tick_logs = []
         for n in npcs:
-            if n.alive:
-                n.step(t, predator)
-                if n.log:
-                    current_tick_logs.extend(n.log)
-                    n.log = []
-        
-        if current_tick_logs:
-            logs.extend(current_tick_logs)
-            
+            if n.alive: n.step(t, predator)
+
         env.step()
         weather_log.append({"t": t, "condition": env.weather.condition, "intensity": env.weather.intensity})
 
@@ -937,7 +1098,7 @@ def run_sim(TICKS=400, predator_spawn_interval=80):
             print(f"--- {t} tick: 全員が力尽きた ---")
             break
 
-    return npcs, pd.DataFrame(logs), pd.DataFrame(weather_log)
+    return npcs, env.log_frame(), pd.DataFrame(weather_log)
 
 if __name__ == "__main__":
     final_npcs, df_logs, df_weather = run_sim(TICKS=1200) # 12人体制でより長いシミュレーション
@@ -1,5 +1,5 @@
-import random, math
-from collections import defaultdict
+import random, math, re
+from collections import defaultdict, namedtuple, Counter
 import numpy as np
 import pandas as pd
 
@@ -67,84 +67,211 @@ class DayNightCycle:
 # =========================
 # Environment & Supporting Classes
 # =========================
+def _to_rows(node_dict, dtype):
+    # {座標: {属性}} を構造化配列に移し、dict の値を行番号に置き換える（座標 -> 行の索引になる）
+    rows = np.zeros(len(node_dict), dtype=dtype)
+    for i, (k, v) in enumerate(node_dict.items()):
+        rows[i] = tuple(v[f] for f in dtype.names); node_dict[k] = i
+    return rows
+
 class EnvForageBuff:
-    def __init__(self, size=80, n_berry=40, n_hunt=20, n_water=16, n_caves=10):
+    RAND_POOL_SIZE = 4096
+    # ノード属性は構造化配列（float32）。資源 dict は座標 -> 行番号
+    BERRY_DTYPE = np.dtype([("abundance", "f4"), ("regen", "f4")])
+    HUNT_DTYPE  = np.dtype([("richness", "f4"), ("depletion", "f4")])
+    def __init__(self, size=80, n_berry=40, n_hunt=20, n_water=16, n_caves=10, collect_mode="full"):
         self.size = size
-        self.berries = {}
-        for _ in range(n_berry):
-            x, y = random.randrange(size), random.randrange(size)
-            # ベリーの豊富さと再生率をさらに向上（生存率改善用）
-            self.berries[(x, y)] = {"abundance": random.uniform(0.8, 1.0), "regen": random.uniform(0.015, 0.035)}
-        
-        self.huntzones = {}
-        for _ in range(n_hunt):
-            x, y = random.randrange(size), random.randrange(size)
-            # 狩場の豊富さを向上し、枯渇率を低下
-            self.huntzones[(x, y)] = {"richness": random.uniform(0.6, 0.9), "depletion": random.uniform(0.001, 0.005)}
-        
-        self.water_sources = {(random.randrange(size), random.randrange(size)): {"quality": random.uniform(0.5, 1.0)} for _ in range(n_water)}
-        self.caves = {(random.randrange(size), random.randrange(size)): {"safety_bonus": random.uniform(0.7, 0.9)} for _ in range(n_caves)}
+        # "full": 全イベントを列ログに残す / "counts": action ごとの件数だけ数える（パラメータ掃引用）
+        self.collect_mode = collect_mode; self.action_counts = Counter()
+        # 座標と属性は種類ごとに np.random でまとめて引く（同じセルに重なったら後勝ち）
+        uni = np.random.uniform
+        def cells(n): return map(tuple, np.random.randint(0, size, size=(n, 2)).tolist())
+        # ベリーの豊富さと再生率をさらに向上（生存率改善用）
+        self.berries = {c: {"abundance": a, "regen": r} for c, a, r in
+                        zip(cells(n_berry), uni(0.8, 1.0, n_berry).tolist(), uni(0.015, 0.035, n_berry).tolist())}
+        # 狩場の豊富さを向上し、枯渇率を低下
+        self.huntzones = {c: {"richness": a, "depletion": r} for c, a, r in
+                          zip(cells(n_hunt), uni(0.6, 0.9, n_hunt).tolist(), uni(0.001, 0.005, n_hunt).tolist())}
+        self.water_sources = {c: {"quality": q} for c, q in zip(cells(n_water), uni(0.5, 1.0, n_water).tolist())}
+        self.caves = {c: {"safety_bonus": b} for c, b in zip(cells(n_caves), uni(0.7, 0.9, n_caves).tolist())}
+        # 毎tick更新するベリー/狩場の属性は配列に移し、更新する列はフィールドビューで直接触る
+        self._berries = _to_rows(self.berries, self.BERRY_DTYPE)
+        self._hunts = _to_rows(self.huntzones, self.HUNT_DTYPE)
+        self._berry_abundance = self._berries["abundance"]; self._berry_regen = self._berries["regen"]
         
         self.t = 0
         self.day_night = DayNightCycle()
         self.weather = Weather()
+        self._refresh_forage_mod()
+        # NPC の判定用一様乱数はまとめて引いてプールから順に使う（スカラー乱数呼び出しのオーバーヘッドを償却）
+        self._refill_rand_pool()
+        # 環境が持つ資源レイヤーだけ座標配列をキャッシュ（一時的な dict は従来どおりソート）
+        self._node_layers = {id(d): None for d in (self.berries, self.huntzones, self.water_sources, self.caves)}
+        # NPC の位置/生存を SoA で保持（nearby_allies を1回のベクトル演算にする）
+        self._npcs = []
+        self._npc_xy = np.zeros((0, 2), dtype=np.int32)
+        self._npc_alive = np.zeros(0, dtype=bool)
+        self._npc_ver = 0  # 位置/生存が変わるたびに増やす（nearby_allies のメモ無効化用）
+        # 全 NPC 共通の列指向イベントログ（NPC ごとの dict リストをやめ、最後に一括で DataFrame 化）
+        self.log_t = []; self.log_name = []; self.log_action = []; self.log_extra = []
+        self._known_masks = {}  # (id(知識 set), id(レイヤー)) -> (要素数, レイヤー上の bool マスク)。知識は増えるだけなので要素数で無効化
     
     def forage(self, pos, node):
         """ベリーの採集を試みる"""
         if node not in self.berries:
             return False, 0.0, 0.0, 0.0
         
-        abundance = self.berries[node]["abundance"]
+        ab = self._berry_abundance; i = self.berries[node]
+        abundance = float(ab[i])
         # 採集成功率をさらに向上（スカウト復帰テスト用）
-        p = 0.9 * abundance  # 0.8から0.9に向上
-        if self.weather.condition == "rainy":
-            p *= (1.0 - 0.2 * self.weather.intensity)  # 雨の影響をさらに緩和
+        p = 0.9 * abundance * self._forage_rain  # 0.8から0.9に向上
         
-        success = random.random() < p
+        success = self.next_rand() < p
         if success:
-            self.berries[node]["abundance"] = max(0.0, self.berries[node]["abundance"] - random.uniform(0.05, 0.2))  # 消耗をさらに減少
-            food = random.uniform(25, 45) * (0.8 + abundance / 2)  # 食料量をさらに増加
+            ab[i] = max(0.0, abundance - (0.05 + 0.15 * self.next_rand()))  # 消耗をさらに減少
+            food = (25 + 20 * self.next_rand()) * (0.8 + abundance / 2)  # 食料量をさらに増加
         else:
             food = 0.0
         risk = 0.05
         return success, food, risk, p
 
     def step(self):
-        for v in self.berries.values(): 
-            v["abundance"] = min(1.0, v["abundance"] + v["regen"] * (1.0 - v["abundance"]))
+        # ベリーの再生を1回のベクトル演算で
+        ab = self._berry_abundance
+        ab += self._berry_regen * (1.0 - ab); np.minimum(ab, 1.0, out=ab)
         self.t += 1
         self.day_night.step()
         self.weather.step()
-        
+        self._refresh_forage_mod()
+
+    def _refresh_forage_mod(self):
+        # 天候は env.step でしか変わらないので、採集成功率の雨補正は tick ごとに1回だけ求める
+        self._forage_rain = (1.0 - 0.2 * self.weather.intensity) if self.weather.condition == "rainy" else 1.0  # 雨の影響をさらに緩和
+        
+    # --- pooled RNG ---
+    def _refill_rand_pool(self):
+        self._rand_pool = np.random.random(self.RAND_POOL_SIZE).tolist(); self._rand_i = 0
+    def next_rand(self):
+        if self._rand_i >= self.RAND_POOL_SIZE: self._refill_rand_pool()
+        r = self._rand_pool[self._rand_i]; self._rand_i += 1
+        return r
+
+    # --- event log ---
+    def log_event(self, t, name, action, extra=None):
+        if self.collect_mode == "counts": self.action_counts[action] += 1; return
+        self.log_t.append(t); self.log_name.append(name); self.log_action.append(action)
+        self.log_extra.append(extra if extra is not None else {})
+    def log_frame(self):
+        # 付帯情報を1回の from_records で組み、固定列は先頭に差し込む
+        df = pd.DataFrame.from_records(self.log_extra)
+        df.insert(0, "action", self.log_action); df.insert(0, "name", self.log_name); df.insert(0, "t", self.log_t)
+        return df
+
+    def register_npc(self, npc):
+        # NPC を SoA に登録して行番号を返す
+        self._npcs.append(npc)
+        self._npc_xy = np.vstack([self._npc_xy, np.array([[npc.x, npc.y]], dtype=np.int32)])
+        self._npc_alive = np.append(self._npc_alive, npc.alive)
+        self._npc_ver += 1
+        return len(self._npcs) - 1
+
+    def _node_layer(self, node_dict):
+        # resource layer -> (keys, (n,2) coords)。ノード数が変わったら作り直す
+        layer = self._node_layers[id(node_dict)]
+        if layer is None or len(layer[0]) != len(node_dict):
+            keys = list(node_dict.keys())
+            layer = (keys, np.array(keys, dtype=np.int32).reshape(-1, 2))
+            self._node_layers[id(node_dict)] = layer
+        return layer
+
+    def nearest_known(self, pos, node_dict, known, k=1):
+        # 既知ノード（known set）だけから近い順に k 件。フィルタ済み dict を作らずマスクで絞る
+        if not known: return []
+        keys, pts = self._node_layer(node_dict)
+        mk = (id(known), id(node_dict)); hit = self._known_masks.get(mk)
+        if hit is None or hit[0] != len(known) or len(hit[1]) != len(keys):
+            hit = self._known_masks[mk] = (len(known), np.fromiter((key in known for key in keys), dtype=bool, count=len(keys)))
+        idx = np.flatnonzero(hit[1])
+        if not len(idx): return []
+        d = np.abs(pts[idx, 0] - pos[0]) + np.abs(pts[idx, 1] - pos[1])
+        if k == 1: return [keys[idx[int(d.argmin())]]]
+        return [keys[idx[j]] for j in np.argsort(d, kind="stable")[:k]]
+
     def nearest_nodes(self, pos, node_dict, k=4):
-        nodes = list(node_dict.keys())
-        if not nodes: return []
-        nodes.sort(key=lambda p: abs(p[0] - pos[0]) + abs(p[1] - pos[1]))
-        return nodes[:k]
+        if not node_dict: return []
+        if id(node_dict) not in self._node_layers:
+            nodes = list(node_dict.keys())
+            nodes.sort(key=lambda p: abs(p[0] - pos[0]) + abs(p[1] - pos[1]))
+            return nodes[:k]
+        # 距離計算を1回のベクトル演算に。同距離は登録順（安定ソート）
+        keys, pts = self._node_layer(node_dict)
+        d = np.abs(pts[:, 0] - pos[0]) + np.abs(pts[:, 1] - pos[1])
+        if k == 1: return [keys[int(d.argmin())]]
+        if k >= len(keys): return [keys[i] for i in np.argsort(d, kind="stable")]
+        # argpartition で k 番目の距離だけ求め、それ以下の候補だけを安定ソート（同距離は登録順）
+        kth = d[np.argpartition(d, k - 1)[k - 1]]
+        cand = np.flatnonzero(d <= kth)
+        return [keys[i] for i in cand[np.argsort(d[cand], kind="stable")[:k]]]
 
 # =========================
 # Territory & NPC Class
 # =========================
 class Territory:
+    __slots__ = ("owner", "center", "radius")
     def __init__(self, owner, center, radius):
         self.owner = owner
         self.center = center
         self.radius = radius
 
+# =========================
+# NPC numeric kernels（プリミティブ引数だけを取る純粋なスカラー計算）
+# =========================
+def exploration_pressure(ticks_since_discovery, n_cave, total_cave, n_water, total_water,
+                         n_berry, total_berry, n_hunt, total_hunt, info_bonus):
+    """探索圧力 — 既知数/総数と情報提供ボーナスだけから決まる（上限 2.5）"""
+    pressure = min(1.0, ticks_since_discovery / 150.0) * 0.6
+    # 全リソースタイプの未発見状況を考慮した探索圧力
+    total_unknown_pressure = 0.0
+    if n_cave < total_cave: total_unknown_pressure += (1.0 - n_cave / total_cave) * 0.25      # 洞窟
+    if n_water < total_water: total_unknown_pressure += (1.0 - n_water / total_water) * 0.25  # 水源
+    if n_berry < total_berry: total_unknown_pressure += (1.0 - n_berry / total_berry) * 0.3   # ベリー（食料は重要なので重み大）
+    if n_hunt < total_hunt: total_unknown_pressure += (1.0 - n_hunt / total_hunt) * 0.2       # 狩場
+    pressure += total_unknown_pressure
+    if info_bonus: pressure += info_bonus
+    return min(2.5, pressure)
+
+def resource_stability(hunger, thirst, fatigue, known_resources, total_resources):
+    """リソース安定性 — 生理ニーズの充足度 6 割 + 既知リソース割合 4 割（上限 1.0）"""
+    basic_needs = (max(0, (70 - hunger) / 70) + max(0, (70 - thirst) / 70) + max(0, (70 - fatigue) / 70)) / 3
+    stability_score = basic_needs * 0.6
+    if total_resources > 0: stability_score += known_resources / total_resources * 0.4
+    return min(1.0, stability_score)
+
 # =========================
 # NPC Class (16人拡張版)
 # =========================
 class NPCPriority:
+    # 属性は固定（__dict__ を持たない）。スカウト復帰系の属性（consider_scout_reversion 用）も __init__ で初期化する
+    __slots__ = ("name", "env", "roster_ref", "x", "y", "xy", "hunger", "thirst", "fatigue", "alive", "rid",
+                 "_allies_cache", "_allies_ver", "kappa", "E", "T0", "T",
+                 "curiosity", "risk_tolerance", "empathy", "rel",
+                 "role", "exploration_mode", "exploration_mode_start_tick", "exploration_intensity", "mode_stability_counter",
+                 "age", "experience_points", "lifetime_discoveries", "lifetime_shares", "retirement_readiness",
+                 "retired", "mentor_target", "knowledge_legacy", "last_discovery_tick",
+                 "knowledge_caves", "knowledge_water", "knowledge_berries", "knowledge_huntzones",
+                 "resource_stability_counter", "scout_start_tick", "original_role", "discovery_reward_multiplier")
     def __init__(self, name, preset, env, roster_ref, start_pos):
         self.name = name
         self.env = env
         self.roster_ref = roster_ref
         self.x, self.y = start_pos
+        self.xy = (self.x, self.y)  # 座標タプル。x/y を動かしたら sync_pos で作り直す（pos() のたびに作らない）
         self.hunger = 20.0  # 初期空腹度をさらに低く（スカウト復帰テスト用）
         self.thirst = 10.0  # 初期渇きをさらに低く
         self.fatigue = 20.0  # 初期疲労をさらに低く
         self.alive = True
-        self.log = []
+        self.rid = env.register_npc(self)
+        self._allies_cache = {}; self._allies_ver = -1  # radius -> 近隣リスト（誰も動かない間は再利用）
         
         # SSD パラメータ
         self.kappa = defaultdict(lambda: 0.1)
@@ -153,9 +280,9 @@ class NPCPriority:
         self.T = self.T0
 
         # 性格プリセット
-        self.curiosity = preset["curiosity"]
-        self.risk_tolerance = preset["risk_tolerance"]
-        self.empathy = preset.get("empathy", 0.6)
+        self.curiosity = preset.curiosity
+        self.risk_tolerance = preset.risk_tolerance
+        self.empathy = preset.empathy
 
         # 関係性の初期化
         self.rel = defaultdict(float)
@@ -166,6 +293,11 @@ class NPCPriority:
         self.exploration_mode_start_tick = 0  # 探索モード開始時刻
         self.exploration_intensity = 1.0  # 探索の強度倍率
         self.mode_stability_counter = 0  # モード安定性カウンター
+        # スカウト復帰関連（consider_scout_reversion）
+        self.original_role = self.role     # 復帰先の役割
+        self.scout_start_tick = 0          # スカウト開始時刻
+        self.resource_stability_counter = 0  # リソース安定が続いたtick数
+        self.discovery_reward_multiplier = 1.0  # 発見報酬倍率
         
         # 引退システム関連（無効化中）
         self.age = random.randint(20, 40)  # 初期年齢
@@ -185,20 +317,20 @@ class NPCPriority:
         self.knowledge_huntzones = set()  # 狩場の知識
         
         # 初期知識を最小限に：最低限のリソースのみ知っている状態
-        initial_cave = self.env.nearest_nodes(self.pos(), self.env.caves, k=1)
+        initial_cave = self.env.nearest_nodes(self.xy, self.env.caves, k=1)
         if initial_cave: self.knowledge_caves.add(initial_cave[0])
         
         # 水源知識を大幅増加（水不足を防ぐ）
-        initial_waters = self.env.nearest_nodes(self.pos(), self.env.water_sources, k=4)
+        initial_waters = self.env.nearest_nodes(self.xy, self.env.water_sources, k=4)
         for water in initial_waters:
             self.knowledge_water.add(water)
             
-        initial_berries = self.env.nearest_nodes(self.pos(), self.env.berries, k=1)
+        initial_berries = self.env.nearest_nodes(self.xy, self.env.berries, k=1)
         for berry in initial_berries:
             self.knowledge_berries.add(berry)
 
     def pos(self):
-        return (self.x, self.y)
+        return self.xy
         
     def dist_to(self, o):
         return abs(self.x - o.x) + abs(self.y - o.y)
@@ -212,39 +344,29 @@ class NPCPriority:
         self.y += (1 if ty > self.y else -1 if ty < self.y else 0)
         self.x = max(0, min(self.env.size - 1, self.x))
         self.y = max(0, min(self.env.size - 1, self.y))
+        self.sync_pos()
+
+    def sync_pos(self):
+        self.xy = xy = (self.x, self.y)
+        self.env._npc_xy[self.rid] = xy; self.env._npc_ver += 1
         
     def nearby_allies(self, radius=3):
-        return [o for on, o in self.roster_ref.items() if on != self.name and o.alive and self.dist_to(o) <= radius]
+        # SoA 位置配列に対する1回のマスク計算。結果は誰も動かない/死なない間は半径ごとに再利用
+        env = self.env
+        if self._allies_ver != env._npc_ver:
+            self._allies_cache.clear(); self._allies_ver = env._npc_ver
+        hit = self._allies_cache.get(radius)
+        if hit is None:
+            xy = env._npc_xy
+            near = env._npc_alive & (np.abs(xy[:, 0] - self.x) + np.abs(xy[:, 1] - self.y) <= radius)
+            near[self.rid] = False
+            hit = self._allies_cache[radius] = [env._npcs[i] for i in np.flatnonzero(near)]
+        return list(hit)
 
     # 拡張された探索圧力計算
     def calculate_exploration_pressure(self):
-        pressure = 0.0
-        ticks_since_discovery = self.env.t - self.last_discovery_tick
-        boredom = min(1.0, ticks_since_discovery / 150.0)
-        pressure += boredom * 0.6
-        
-        # 全リソースタイプの未発見状況を考慮した探索圧力
-        total_unknown_pressure = 0.0
-        
-        if len(self.knowledge_caves) < len(self.env.caves):
-            cave_ratio = 1.0 - len(self.knowledge_caves) / len(self.env.caves)
-            total_unknown_pressure += cave_ratio * 0.25
-            
-        if len(self.knowledge_water) < len(self.env.water_sources):
-            water_ratio = 1.0 - len(self.knowledge_water) / len(self.env.water_sources)
-            total_unknown_pressure += water_ratio * 0.25
-            
-        if len(self.knowledge_berries) < len(self.env.berries):
-            berry_ratio = 1.0 - len(self.knowledge_berries) / len(self.env.berries)
-            total_unknown_pressure += berry_ratio * 0.3  # 食料は重要なので重み大
-            
-        if len(self.knowledge_huntzones) < len(self.env.huntzones):
-            hunt_ratio = 1.0 - len(self.knowledge_huntzones) / len(self.env.huntzones)
-            total_unknown_pressure += hunt_ratio * 0.2
-            
-        pressure += total_unknown_pressure
-        
         # 探索モード中は他者の情報不足がさらなる探索圧力を生む
+        info_bonus = 0.0
         if self.exploration_mode:
             allies_needing_info = 0
             for ally in self.nearby_allies(radius=100):
@@ -252,9 +374,14 @@ class NPCPriority:
                     len(ally.knowledge_berries) < len(self.knowledge_berries) or
                     len(ally.knowledge_huntzones) < len(self.knowledge_huntzones)):
                     allies_needing_info += 1
-            if allies_needing_info > 0: pressure += 0.3 * self.exploration_intensity
-            
-        return min(2.5, pressure)
+            if allies_needing_info > 0: info_bonus = 0.3 * self.exploration_intensity
+        env = self.env
+        return exploration_pressure(env.t - self.last_discovery_tick,
+                                    len(self.knowledge_caves), len(env.caves),
+                                    len(self.knowledge_water), len(env.water_sources),
+                                    len(self.knowledge_berries), len(env.berries),
+                                    len(self.knowledge_huntzones), len(env.huntzones),
+                                    info_bonus)
     
 
 
@@ -283,7 +410,7 @@ class NPCPriority:
         self.experience_points += pleasure * 0.3
         self.lifetime_discoveries += 1
         
-        self.log.append({"t": t, "name": self.name, "action": f"discovery_pleasure_{resource_type}", "pleasure": pleasure})
+        self.env.log_event(t, self.name, f"discovery_pleasure_{resource_type}", {"pleasure": pleasure})
         return pleasure
 
     def consider_exploration_mode_shift(self, t):
@@ -306,15 +433,14 @@ class NPCPriority:
         exploration_experience = self.kappa.get("exploration", 0.1)
         leap_probability = min(0.8, exploration_pressure / 2.0) * (0.5 + exploration_experience)
         
-        if exploration_pressure > pressure_threshold and random.random() < leap_probability:
+        if exploration_pressure > pressure_threshold and self.env.next_rand() < leap_probability:
             # 探索モードへの跳躍的変化
             self.exploration_mode = True
             self.exploration_mode_start_tick = t
             self.exploration_intensity = 1.0 + exploration_pressure * 0.5  # 圧力に応じた強度
             self.mode_stability_counter = 0
             
-            self.log.append({"t": t, "name": self.name, "action": "exploration_mode_leap", 
-                           "pressure": exploration_pressure, "intensity": self.exploration_intensity})
+            self.env.log_event(t, self.name, "exploration_mode_leap", {"pressure": exploration_pressure, "intensity": self.exploration_intensity})
             return True
             
         return False
@@ -337,10 +463,10 @@ class NPCPriority:
         
         # デバッグ情報（必要時）
         if mode_duration > 30 and t % 30 == 0:
-            self.log.append({"t": t, "name": self.name, "action": "mode_reversion_check", 
-                           "stability_counter": self.mode_stability_counter, 
-                           "duration": mode_duration, "threshold": reversion_threshold,
-                           "exploration_pressure": exploration_pressure, "stability": resource_stability})
+            self.env.log_event(t, self.name, "mode_reversion_check",
+                               {"stability_counter": self.mode_stability_counter,
+                                "duration": mode_duration, "threshold": reversion_threshold,
+                                "exploration_pressure": exploration_pressure, "stability": resource_stability})
         
         if (self.mode_stability_counter >= reversion_threshold and 
             mode_duration > 10 and
@@ -354,8 +480,7 @@ class NPCPriority:
             # 探索経験を少し減衰（忘却効果）
             self.kappa["exploration"] = max(0.05, self.kappa.get("exploration", 0.1) * 0.9)
             
-            self.log.append({"t": t, "name": self.name, "action": "exploration_mode_reversion", 
-                           "duration": mode_duration, "stability": resource_stability})
+            self.env.log_event(t, self.name, "exploration_mode_reversion", {"duration": mode_duration, "stability": resource_stability})
             return True
         
         return False
@@ -369,15 +494,14 @@ class NPCPriority:
         exploration_experience = self.kappa.get("exploration", 0.1)
         leap_probability = min(0.8, exploration_pressure / 2.0) * (0.5 + exploration_experience)
         
-        if exploration_pressure > pressure_threshold and random.random() < leap_probability:
+        if exploration_pressure > pressure_threshold and self.env.next_rand() < leap_probability:
             # 探索モードへの跳躍的変化
             self.exploration_mode = True
             self.exploration_mode_start_tick = t
             self.exploration_intensity = 1.0 + exploration_pressure * 0.5  # 圧力に応じた強度
             self.mode_stability_counter = 0
             
-            self.log.append({"t": t, "name": self.name, "action": "exploration_mode_leap", 
-                           "pressure": exploration_pressure, "intensity": self.exploration_intensity})
+            self.env.log_event(t, self.name, "exploration_mode_leap", {"pressure": exploration_pressure, "intensity": self.exploration_intensity})
             return True
             
         return False
@@ -401,10 +525,10 @@ class NPCPriority:
         
         # デバッグ用：復帰検討の詳細をログ出力
         if scout_duration > 50 and t % 50 == 0:  # 50tickごとに状況をログ
-            self.log.append({"t": t, "name": self.name, "action": "scout_reversion_check", 
-                           "stability_counter": self.resource_stability_counter, 
-                           "duration": scout_duration, "threshold": reversion_threshold,
-                           "exploration_pressure": exploration_pressure, "stability": resource_stability})
+            self.env.log_event(t, self.name, "scout_reversion_check",
+                               {"stability_counter": self.resource_stability_counter,
+                                "duration": scout_duration, "threshold": reversion_threshold,
+                                "exploration_pressure": exploration_pressure, "stability": resource_stability})
         
         if (self.resource_stability_counter >= 20 and 
             scout_duration > reversion_threshold and
@@ -419,36 +543,21 @@ class NPCPriority:
             # 復帰時に探索経験を少し減衰（忘却効果）
             self.kappa["exploration"] = max(0.05, self.kappa.get("exploration", 0.1) * 0.8)
             
-            self.log.append({"t": t, "name": self.name, "action": "scout_reversion", 
-                           "from_role": old_role, "to_role": self.role, 
-                           "duration": scout_duration, "stability": resource_stability})
+            self.env.log_event(t, self.name, "scout_reversion",
+                               {"from_role": old_role, "to_role": self.role,
+                                "duration": scout_duration, "stability": resource_stability})
             return True
         
         return False
     
     def evaluate_resource_stability(self):
         """現在のリソース安定性を評価"""
-        stability_score = 0.0
-        
-        # 基本生理ニーズの充足度
-        hunger_stability = max(0, (70 - self.hunger) / 70)  # 空腹度が低いほど安定
-        thirst_stability = max(0, (70 - self.thirst) / 70)  # 渇きが少ないほど安定
-        fatigue_stability = max(0, (70 - self.fatigue) / 70)  # 疲労が少ないほど安定
-        
-        basic_needs = (hunger_stability + thirst_stability + fatigue_stability) / 3
-        stability_score += basic_needs * 0.6
-        
         # 知識の豊富さ（発見済みリソースの割合）
         total_resources = (len(self.env.caves) + len(self.env.water_sources) + 
                           len(self.env.berries) + len(self.env.huntzones))
         known_resources = (len(self.knowledge_caves) + len(self.knowledge_water) + 
                           len(self.knowledge_berries) + len(self.knowledge_huntzones))
-        
-        if total_resources > 0:
-            knowledge_ratio = known_resources / total_resources
-            stability_score += knowledge_ratio * 0.4
-        
-        return min(1.0, stability_score)
+        return resource_stability(self.hunger, self.thirst, self.fatigue, known_resources, total_resources)
 
     def consider_retirement(self, t):
         """引退を検討する"""
@@ -488,9 +597,9 @@ class NPCPriority:
             self.mentor_target = random.choice(potential_mentees)
             self.transfer_knowledge(t, self.mentor_target)
         
-        self.log.append({"t": t, "name": self.name, "action": "retirement", 
-                        "age": self.age, "experience": self.experience_points,
-                        "mentor_target": self.mentor_target.name if self.mentor_target else None})
+        self.env.log_event(t, self.name, "retirement",
+                           {"age": self.age, "experience": self.experience_points,
+                            "mentor_target": self.mentor_target.name if self.mentor_target else None})
         return True
     
     def transfer_knowledge(self, t, mentee):
@@ -531,8 +640,7 @@ class NPCPriority:
             "caves": len(self.knowledge_caves), "berries": len(self.knowledge_berries)
         })
         
-        self.log.append({"t": t, "name": self.name, "action": "knowledge_transfer", 
-                        "mentee": mentee.name, "transferred_exp": transferred_exp})
+        self.env.log_event(t, self.name, "knowledge_transfer", {"mentee": mentee.name, "transferred_exp": transferred_exp})
 
     def elder_activities(self, t):
         """引退者の活動：指導と休息"""
@@ -554,8 +662,7 @@ class NPCPriority:
             
             if potential_mentees:
                 self.mentor_target = random.choice(potential_mentees)
-                self.log.append({"t": t, "name": self.name, "action": "new_mentee_selected", 
-                               "mentee": self.mentor_target.name})
+                self.env.log_event(t, self.name, "new_mentee_selected", {"mentee": self.mentor_target.name})
     
     def provide_ongoing_mentorship(self, t, mentee):
         """継続的な指導を提供"""
@@ -566,8 +673,7 @@ class NPCPriority:
         # 関係性の維持・強化
         mentee.rel[self.name] = min(1.0, mentee.rel.get(self.name, 0) + 0.1)
         
-        self.log.append({"t": t, "name": self.name, "action": "ongoing_mentorship", 
-                        "mentee": mentee.name})
+        self.env.log_event(t, self.name, "ongoing_mentorship", {"mentee": mentee.name})
 
     def share_discovery_with_pleasure(self, t, node, resource_type):
         shared_count = 0
@@ -575,7 +681,7 @@ class NPCPriority:
         for ally in self.nearby_allies(radius=8):
             relationship = self.rel.get(ally.name, 0)
             sharing_probability = 0.3 + 0.7 * relationship
-            if random.random() > sharing_probability: continue
+            if self.env.next_rand() > sharing_probability: continue
             
             # リソースタイプに応じて適切な知識セットを選択
             if resource_type == "cave":
@@ -598,7 +704,7 @@ class NPCPriority:
                 
                 total_approval += ally.rel[self.name]
                 shared_count += 1
-                self.log.append({"t": t, "name": self.name, "action": f"share_{resource_type}_info", "target": ally.name})
+                self.env.log_event(t, self.name, f"share_{resource_type}_info", {"target": ally.name})
         
         if shared_count > 0:
             base_pleasure = 0.3 * shared_count
@@ -611,7 +717,7 @@ class NPCPriority:
             self.experience_points += total_pleasure * 0.2
             self.lifetime_shares += shared_count
             
-            self.log.append({"t": t, "name": self.name, "action": "approval_pleasure", "pleasure": total_pleasure})
+            self.env.log_event(t, self.name, "approval_pleasure", {"pleasure": total_pleasure})
 
     def exploration_mode_action(self, t):
         """探索モード中の積極的な探索行動"""
@@ -620,18 +726,20 @@ class NPCPriority:
         
         # 探索モードの強度に応じた行動
         action_intensity = "intensive" if self.exploration_intensity > 1.3 else "moderate"
-        self.log.append({"t": t, "name": self.name, "action": f"exploration_mode_active", "intensity": action_intensity})
+        self.env.log_event(t, self.name, f"exploration_mode_active", {"intensity": action_intensity})
         
         # 強度に応じた移動範囲
         movement_range = 2 if self.exploration_intensity > 1.3 else 1
-        dx = random.choice(list(range(-movement_range, movement_range + 1)))
-        dy = random.choice(list(range(-movement_range, movement_range + 1)))
+        span = 2 * movement_range + 1; next_rand = self.env.next_rand
+        dx = int(next_rand() * span) - movement_range
+        dy = int(next_rand() * span) - movement_range
         
         # 移動実行
         new_x = self.x + dx
         new_y = self.y + dy
         self.x = max(0, min(self.env.size - 1, new_x))
         self.y = max(0, min(self.env.size - 1, new_y))
+        self.sync_pos()
 
         # 探索モード中は発見範囲が拡大
         detection_range = 3 if self.exploration_intensity > 1.3 else 2
@@ -645,7 +753,7 @@ class NPCPriority:
         ]
         
         for res_type, res_dict, knowledge in resource_types:
-            nearest = self.env.nearest_nodes(self.pos(), res_dict, k=1)
+            nearest = self.env.nearest_nodes(self.xy, res_dict, k=1)
             if nearest:
                 distance = self.dist_to_pos(nearest[0])
                 already_known = nearest[0] in knowledge
@@ -655,8 +763,7 @@ class NPCPriority:
                     # 探索モード中は発見報酬が増加
                     self.experience_discovery_pleasure(t, res_type, nearest[0])
                     self.share_discovery_with_pleasure(t, nearest[0], res_type)
-                    self.log.append({"t": t, "name": self.name, "action": f"discover_{res_type}_exploration_mode", 
-                                   "location": nearest[0], "intensity": self.exploration_intensity})
+                    self.env.log_event(t, self.name, f"discover_{res_type}_exploration_mode", {"location": nearest[0], "intensity": self.exploration_intensity})
         return True
 
 
@@ -669,7 +776,7 @@ class NPCPriority:
         self.fatigue += 0.9  # 疲労の増加を緩和
         # 死亡判定をより緩和（スカウト復帰システムテスト用）
         if self.hunger >= 120 or self.thirst >= 120:
-            self.alive = False
+            self.alive = False; self.env._npc_alive[self.rid] = False; self.env._npc_ver += 1
             return
 
         # 引退システム：年齢更新と引退判定（無効化中）
@@ -695,10 +802,10 @@ class NPCPriority:
 
         # 基本的な生存行動
         if self.thirst > 70:
-            known_water = self.env.nearest_nodes(self.pos(), {k:v for k,v in self.env.water_sources.items() if k in self.knowledge_water}, k=1)
+            known_water = self.env.nearest_known(self.xy, self.env.water_sources, self.knowledge_water, k=1)
             if known_water:
                 target = known_water[0]
-                if self.pos() == target:
+                if self.xy == target:
                     self.thirst = 0
                     self.fatigue = max(0, self.fatigue - 5)  # 水分補給時に休憩効果も付与
                 else:
@@ -707,51 +814,54 @@ class NPCPriority:
         
         if self.hunger > 70:
             # 既知のベリー採取場所を優先的に探す
-            known_berries = {k: v for k, v in self.env.berries.items() if k in self.knowledge_berries}
-            if known_berries:
-                nodes = self.env.nearest_nodes(self.pos(), known_berries, k=1)
+            if self.knowledge_berries:
+                nodes = self.env.nearest_known(self.xy, self.env.berries, self.knowledge_berries, k=1)
             else:
                 # 既知の場所がない場合は近くを探索
-                nodes = self.env.nearest_nodes(self.pos(), self.env.berries, k=1)
+                nodes = self.env.nearest_nodes(self.xy, self.env.berries, k=1)
                 # 新しい場所を発見した場合は知識に追加
                 if nodes and nodes[0] not in self.knowledge_berries:
                     self.knowledge_berries.add(nodes[0])
-                    self.log.append({"t": t, "name": self.name, "action": "discover_berry_patch", "location": nodes[0]})
+                    self.env.log_event(t, self.name, "discover_berry_patch", {"location": nodes[0]})
                     
             if nodes:
                 self.move_towards(nodes[0])
-                success, food, _, _ = self.env.forage(self.pos(), nodes[0])
+                success, food, _, _ = self.env.forage(self.xy, nodes[0])
                 if success:
                     self.hunger -= food
                     self.fatigue = max(0, self.fatigue - 2)  # 成功した採集で少し疲労回復
                 return
 
         # ランダム移動
-        self.move_towards((self.x + random.choice([-1,1]), self.y + random.choice([-1,1])))
+        next_rand = self.env.next_rand
+        self.move_towards((self.x + (-1 if next_rand() < 0.5 else 1), self.y + (-1 if next_rand() < 0.5 else 1)))
 
 # =========================
 # NPC Presets (16人用拡張)
 # =========================
-FORAGER = {"risk_tolerance": 0.2, "curiosity": 0.3, "avoidance": 0.8, "stamina": 0.6, "empathy": 0.8}
-TRACKER = {"risk_tolerance": 0.6, "curiosity": 0.5, "avoidance": 0.2, "stamina": 0.8, "empathy": 0.6}
-PIONEER = {"risk_tolerance": 0.5, "curiosity": 0.9, "avoidance": 0.3, "stamina": 0.7, "empathy": 0.5}
-GUARDIAN = {"risk_tolerance": 0.4, "curiosity": 0.4, "avoidance": 0.6, "stamina": 0.9, "empathy": 0.9}
-ADVENTURER = {"risk_tolerance": 0.8, "curiosity": 0.8, "avoidance": 0.1, "stamina": 0.8, "empathy": 0.4}
-DIPLOMAT = {"risk_tolerance": 0.3, "curiosity": 0.6, "avoidance": 0.4, "stamina": 0.5, "empathy": 0.9}
-LONER = {"risk_tolerance": 0.4, "curiosity": 0.7, "avoidance": 0.9, "stamina": 0.7, "empathy": 0.2}
-LEADER = {"risk_tolerance": 0.6, "curiosity": 0.5, "avoidance": 0.3, "stamina": 0.8, "empathy": 0.7}
+# 性格プリセットは不変の NamedTuple（属性アクセス。empathy 省略時は 0.6）
+Preset = namedtuple("Preset", "risk_tolerance curiosity avoidance stamina empathy", defaults=(0.6,))
+FORAGER = Preset(risk_tolerance=0.2, curiosity=0.3, avoidance=0.8, stamina=0.6, empathy=0.8)
+TRACKER = Preset(risk_tolerance=0.6, curiosity=0.5, avoidance=0.2, stamina=0.8, empathy=0.6)
+PIONEER = Preset(risk_tolerance=0.5, curiosity=0.9, avoidance=0.3, stamina=0.7, empathy=0.5)
+GUARDIAN = Preset(risk_tolerance=0.4, curiosity=0.4, avoidance=0.6, stamina=0.9, empathy=0.9)
+ADVENTURER = Preset(risk_tolerance=0.8, curiosity=0.8, avoidance=0.1, stamina=0.8, empathy=0.4)
+DIPLOMAT = Preset(risk_tolerance=0.3, curiosity=0.6, avoidance=0.4, stamina=0.5, empathy=0.9)
+LONER = Preset(risk_tolerance=0.4, curiosity=0.7, avoidance=0.9, stamina=0.7, empathy=0.2)
+LEADER = Preset(risk_tolerance=0.6, curiosity=0.5, avoidance=0.3, stamina=0.8, empathy=0.7)
 # 16人構成用の追加性格タイプ
-SCHOLAR = {"risk_tolerance": 0.2, "curiosity": 0.9, "avoidance": 0.7, "stamina": 0.4, "empathy": 0.6}
-WARRIOR = {"risk_tolerance": 0.9, "curiosity": 0.3, "avoidance": 0.1, "stamina": 0.9, "empathy": 0.3}
-HEALER = {"risk_tolerance": 0.2, "curiosity": 0.5, "avoidance": 0.8, "stamina": 0.6, "empathy": 0.9}
-NOMAD = {"risk_tolerance": 0.7, "curiosity": 0.8, "avoidance": 0.2, "stamina": 0.9, "empathy": 0.4}
+SCHOLAR = Preset(risk_tolerance=0.2, curiosity=0.9, avoidance=0.7, stamina=0.4, empathy=0.6)
+WARRIOR = Preset(risk_tolerance=0.9, curiosity=0.3, avoidance=0.1, stamina=0.9, empathy=0.3)
+HEALER = Preset(risk_tolerance=0.2, curiosity=0.5, avoidance=0.8, stamina=0.6, empathy=0.9)
+NOMAD = Preset(risk_tolerance=0.7, curiosity=0.8, avoidance=0.2, stamina=0.9, empathy=0.4)
 
 # =========================
 # Main Execution (16人版)
 # =========================
-def run_sim(TICKS=1500):  # より長期間のシミュレーション
+def run_sim(TICKS=1500, collect_mode="full"):  # より長期間のシミュレーション
+    # collect_mode="counts" ではログ DataFrame を作らず、action -> 件数の Counter を返す
     # 16人の生存を確実にした超豊富なリソース環境（スカウト復帰システム実証用）
-    env = EnvForageBuff(size=90, n_berry=120, n_hunt=60, n_water=40, n_caves=25)
+    env = EnvForageBuff(size=90, n_berry=120, n_hunt=60, n_water=40, n_caves=25, collect_mode=collect_mode)
     roster = {}
     
     # NPCの人数を16人に大幅増加（4つのグループに分散配置）
@@ -786,36 +896,30 @@ def run_sim(TICKS=1500):  # より長期間のシミュレーション
     for npc in npcs:
         roster[npc.name] = npc
     
-    # 全NPCが生成された後に初期関係性を設定
-    for npc in npcs:
-        for other in npcs:
-            if npc.name != other.name:
-                initial_distance = npc.dist_to(other)
-                if initial_distance < 5:
-                    npc.rel[other.name] = 0.3
+    # 全NPCが生成された後に初期関係性を設定（全ペアのマンハッタン距離を1回で計算）
+    xy = env._npc_xy
+    D = np.abs(xy[:, None, 0] - xy[None, :, 0]) + np.abs(xy[:, None, 1] - xy[None, :, 1])
+    np.fill_diagonal(D, 5)  # 自分自身は対象外
+    for i, j in zip(*np.nonzero(D < 5)):
+        npcs[i].rel[npcs[j].name] = 0.3
 
-    logs = []
     weather_log = []
     for t in range(TICKS):
-        current_tick_logs = []
-        for n in npcs:
-            if n.alive:
-                n.step(t)
-                if n.log:
-                    current_tick_logs.extend(n.log)
-                    n.log = []
-        
-        if current_tick_logs:
-            logs.extend(current_tick_logs)
-            
+        # 生存者は SoA の生存マスクから一括で選ぶ（各 NPC の step で死ぬのは自分自身だけ）
+        for i in np.flatnonzero(env._npc_alive).tolist():
+            npcs[i].step(t)
+
         env.step()
         weather_log.append({"t": t, "condition": env.weather.condition, "intensity": env.weather.intensity})
 
-        if not any(n.alive for n in npcs):
+        if not env._npc_alive.any():
             print(f"--- {t} tick: 全員が力尽きた ---")
             break
 
-    return npcs, pd.DataFrame(logs), pd.DataFrame(weather_log)
+    if collect_mode == "counts": return npcs, env.action_counts, pd.DataFrame(weather_log)
+    # name/action は種類が少ないので category に（== やグループ化がコード比較になる）
+    df_logs = env.log_frame().astype({"name": "category", "action": "category"})
+    return npcs, df_logs, pd.DataFrame(weather_log)
 
 if __name__ == "__main__":
     final_npcs, df_logs, df_weather = run_sim(TICKS=1200)
@@ -823,28 +927,29 @@ if __name__ == "__main__":
     print(f"Survivors: {sum(1 for n in final_npcs if n.alive)} / {len(final_npcs)}")
     
     if not df_logs.empty:
+        # ログの走査は groupby の1回ずつにまとめ、以降は集計結果/グループを引くだけにする
+        by_action = df_logs.groupby('action', sort=False, observed=True)
+        counts = by_action.size()
+        pair_counts = df_logs.groupby(['name', 'action'], sort=False, observed=True).size()
+        def action_rows(action):
+            return by_action.get_group(action) if action in counts.index else df_logs.iloc[:0]
+
+        last_tick = df_logs.groupby('name', sort=False, observed=True)['t'].max()
         for npc in final_npcs:
-            if not npc.alive:
-                death_log = df_logs[(df_logs['name'] == npc.name)]
-                if not death_log.empty:
-                    print(f"- {npc.name}: Died around tick {df_logs[df_logs['name'] == npc.name]['t'].max()}")
+            if not npc.alive and npc.name in last_tick.index:
+                print(f"- {npc.name}: Died around tick {last_tick[npc.name]}")
 
         # 新しいリソース発見のサマリー
         print("\n--- Resource Discovery Summary ---")
-        cave_discoveries = df_logs[df_logs['action'] == 'discover_cave']
-        water_discoveries = df_logs[df_logs['action'] == 'discover_water']
-        berry_discoveries = df_logs[df_logs['action'] == 'discover_berry_patch']
-        hunt_discoveries = df_logs[df_logs['action'] == 'discover_hunting_ground']
-        
-        print(f"Caves discovered: {len(cave_discoveries)}")
-        print(f"Water sources discovered: {len(water_discoveries)}")
-        print(f"Berry patches discovered: {len(berry_discoveries)}")
-        print(f"Hunting grounds discovered: {len(hunt_discoveries)}")
+        print(f"Caves discovered: {counts.get('discover_cave', 0)}")
+        print(f"Water sources discovered: {counts.get('discover_water', 0)}")
+        print(f"Berry patches discovered: {counts.get('discover_berry_patch', 0)}")
+        print(f"Hunting grounds discovered: {counts.get('discover_hunting_ground', 0)}")
 
         # 意味圧による探索モードの跳躍的変化サマリー
         print("\n--- Exploration Mode Leap Summary ---")
-        exploration_leaps = df_logs[df_logs['action'] == 'exploration_mode_leap']
-        mode_reversions = df_logs[df_logs['action'] == 'exploration_mode_reversion']
+        exploration_leaps = action_rows('exploration_mode_leap')
+        mode_reversions = action_rows('exploration_mode_reversion')
         
         if not exploration_leaps.empty:
             for _, leap in exploration_leaps.iterrows():
@@ -856,13 +961,12 @@ if __name__ == "__main__":
 
             print("\n--- Exploration Mode Activity ---")
             explorers = exploration_leaps['name'].unique()
+            # 正規表現は行ではなく種類の少ない action 名に対してだけ評価する
+            discovery_kinds = [a for a in counts.index if re.search('discover_.*_exploration_mode', a)]
             for explorer_name in explorers:
-                explorer_logs = df_logs[df_logs['name'] == explorer_name]
-                
-                exploration_actions = explorer_logs[explorer_logs['action'] == 'exploration_mode_active']
-                discovery_actions = explorer_logs[explorer_logs['action'].str.contains('discover_.*_exploration_mode')]
-                
-                print(f"{explorer_name}: {len(exploration_actions)} exploration mode actions, {len(discovery_actions)} discoveries")
+                n_active = pair_counts.get((explorer_name, 'exploration_mode_active'), 0)
+                n_discover = sum(pair_counts.get((explorer_name, a), 0) for a in discovery_kinds)
+                print(f"{explorer_name}: {n_active} exploration mode actions, {n_discover} discoveries")
         else:
             print("No one entered exploration mode in this simulation.")
         
@@ -879,7 +983,7 @@ if __name__ == "__main__":
             print("No exploration mode reversions occurred in this simulation.")
             
             # モード復帰検討の詳細情報を表示
-            reversion_checks = df_logs[df_logs['action'] == 'mode_reversion_check']
+            reversion_checks = action_rows('mode_reversion_check')
             if not reversion_checks.empty:
                 print("\n--- Exploration Mode Reversion Check Details ---")
                 for _, check in reversion_checks.iterrows():
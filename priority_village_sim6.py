@@ -1,4 +1,4 @@
-import random, math
+import random, math, heapq
 from collections import defaultdict
 import numpy as np
 import pandas as pd
@@ -68,6 +68,7 @@ class DayNightCycle:
 # Environment & Supporting Classes
 # =========================
 class EnvForageBuff:
+    GRID_CELL = 3  # 資源グリッドの最小セル幅（探索時の発見距離に合わせる）
     def __init__(self, size=80, n_berry=40, n_hunt=20, n_water=16, n_caves=10):
         self.size = size
         self.berries = {}
@@ -89,10 +90,26 @@ class EnvForageBuff:
         self.day_night = DayNightCycle()
         self.weather = Weather()
         
+        # 縄張り中心 → その縄張りを持つ生存NPC数（NPCPriority.set_territory / die で更新）
+        self.territory_centers = defaultdict(int)
+        
         # 捕食者システム
         self.predators = []  # アクティブな捕食者のリスト
         self.predator_spawn_probability = 0.003  # 毎ティック0.3%の捕食者出現確率
         self.predator_activity_modifier = {'sunny': 0.7, 'rainy': 1.3}  # 天候による活動度変化
+        
+        # NPC の位置/生存を SoA で保持（nearby_allies を1回のベクトル演算にする）
+        self._npcs = []
+        self._npc_xy = np.zeros((0, 2), dtype=np.int32)
+        self._npc_alive = np.zeros(0, dtype=bool)
+        
+        # 資源は移動も増減もしないので、種類ごとの総数と空間ハッシュを一度だけ作る
+        self.n_caves, self.n_water = len(self.caves), len(self.water_sources)
+        self.n_berries, self.n_huntzones = len(self.berries), len(self.huntzones)
+        self.n_resources = self.n_caves + self.n_water + self.n_berries + self.n_huntzones
+        self._grids = {kind: self._build_grid(d) for kind, d in
+                       (("caves", self.caves), ("water", self.water_sources),
+                        ("berries", self.berries), ("huntzones", self.huntzones))}
     
     def forage(self, pos, node):
         """ベリーの採集を試みる"""
@@ -153,6 +170,40 @@ class EnvForageBuff:
         
         return predator_attacks if predator_attacks else []
         
+    def register_npc(self, npc):
+        # NPC を SoA に登録して行番号を返す
+        self._npcs.append(npc)
+        self._npc_xy = np.vstack([self._npc_xy, np.array([[npc.x, npc.y]], dtype=np.int32)])
+        self._npc_alive = np.append(self._npc_alive, npc.alive)
+        return len(self._npcs) - 1
+        
+    def _build_grid(self, node_dict):
+        # セル幅は1セルに1個程度になるよう密度で決める（疎な資源で空セルを舐め回さない）
+        c = max(self.GRID_CELL, int(self.size / math.sqrt(max(1, len(node_dict)))))
+        grid = defaultdict(list)
+        for i, (x, y) in enumerate(node_dict):
+            grid[(x // c, y // c)].append((i, (x, y)))
+        return c, grid, -(-self.size // c)
+
+    def nearest_nodes_fast(self, pos, kind, k=1, restrict=None):
+        # 近傍セルからリング状に広げ、未走査セルより確実に近い k 件が揃ったら打ち切る。
+        # 同距離は登録順（nearest_nodes の安定ソートと同じ結果）。restrict（既知 set）があればその中だけ
+        if restrict is not None and not restrict: return []
+        c, grid, n_cells = self._grids[kind]
+        x, y = pos; cx, cy = x // c, y // c
+        cands = []; r = 0
+        while r <= n_cells:
+            for gx in range(cx - r, cx + r + 1):
+                ring_y = range(cy - r, cy + r + 1) if gx in (cx - r, cx + r) else (cy - r, cy + r)
+                for gy in ring_y:
+                    for i, node in grid.get((gx, gy), ()):
+                        if restrict is not None and node not in restrict: continue
+                        cands.append((abs(node[0] - x) + abs(node[1] - y), i, node))
+            # リング r の外側のノードは距離 r*c+1 以上
+            if len(cands) >= k and heapq.nsmallest(k, cands)[-1][0] <= r * c: break
+            r += 1
+        return [node for _, _, node in heapq.nsmallest(k, cands)]
+
     def nearest_nodes(self, pos, node_dict, k=4):
         nodes = list(node_dict.keys())
         if not nodes: return []
@@ -230,7 +281,7 @@ class Predator:
                 }
                 
                 if target_npc.fatigue >= 100:  # 致命傷
-                    target_npc.alive = False
+                    target_npc.die()
                     attack_result["fatal"] = True
                 
                 self.hunger = max(0, self.hunger - 50)  # 捕食者の満腹度回復
@@ -313,6 +364,35 @@ class Territory:
         self.social_members.discard(member_name)
         self.bonding_strength.pop(member_name, None)
 
+# kappa 配列の添字
+K_EXPLORATION, K_SOCIAL = range(2)
+N_KAPPA = 2
+
+# =========================
+# NPC numeric kernels（プリミティブ引数だけを取る純粋なスカラー計算）
+# =========================
+def exploration_pressure(ticks_since_discovery, n_cave, total_cave, n_water, total_water,
+                         n_berry, total_berry, n_hunt, total_hunt, info_bonus):
+    """探索圧力 — 既知数/総数と情報提供ボーナスだけから決まる（上限 2.5）"""
+    pressure = min(1.0, ticks_since_discovery / 150.0) * 0.6
+    # 全リソースタイプの未発見状況を考慮した探索圧力
+    total_unknown_pressure = 0.0
+    if n_cave < total_cave: total_unknown_pressure += (1.0 - n_cave / total_cave) * 0.25      # 洞窟
+    if n_water < total_water: total_unknown_pressure += (1.0 - n_water / total_water) * 0.25  # 水源
+    if n_berry < total_berry: total_unknown_pressure += (1.0 - n_berry / total_berry) * 0.3   # ベリー（食料は重要なので重み大）
+    if n_hunt < total_hunt: total_unknown_pressure += (1.0 - n_hunt / total_hunt) * 0.2       # 狩場
+    pressure += total_unknown_pressure
+    if info_bonus: pressure += info_bonus
+    return min(2.5, pressure)
+
+def resource_stability(hunger, thirst, fatigue, known_resources, total_resources):
+    """リソース安定性 — 生理ニーズの充足度 6 割 + 既知リソース割合 4 割（上限 1.0）"""
+    basic_needs = (max(0, (70 - hunger) / 70) + max(0, (70 - thirst) / 70) + max(0, (70 - fatigue) / 70)) / 3
+    stability_score = basic_needs * 0.6
+    if total_resources > 0: stability_score += known_resources / total_resources * 0.4
+    return min(1.0, stability_score)
+
+
 # =========================
 # NPC Class (16人拡張版)
 # =========================
@@ -326,10 +406,13 @@ class NPCPriority:
         self.thirst = 10.0  # 初期渇きをさらに低く
         self.fatigue = 20.0  # 初期疲労をさらに低く
         self.alive = True
+        self.rid = env.register_npc(self)  # env 側 SoA の行番号
         self.log = []
         
         # SSD パラメータ
-        self.kappa = defaultdict(lambda: 0.1)
+        # kappa: 経験ごとの整合慣性（未経験は 0.1）。social_seen は社交 kappa を一度でも更新したか
+        self.kappa = np.full(N_KAPPA, 0.1)
+        self.social_seen = False
         self.E = 0.0
         self.T0 = 0.3
         self.T = self.T0
@@ -349,13 +432,16 @@ class NPCPriority:
         self.exploration_intensity = 1.0  # 探索の強度倍率
         # 定住整合慣性システム（SSD理論）
         self.settlement_experiences = {'resource_stability': [], 'social_stability': [], 'exploration_satisfaction': []}
-        
+        self.location_social_memories = {}  # 場所ごとの共同体験（オキシトシン的結束）
+        self.territory_loss_experiences = []
+        self.camping_outdoors = False
 
         
         # 基本パラメータ
         self.age = random.randint(20, 40)  # 初期年齢
         self.experience_points = 0.0       # 経験値累積
         self.lifetime_discoveries = 0      # 生涯発見数
+        self.lifetime_shares = 0           # 生涯共有数
         self.last_discovery_tick = 0
         
         # 縄張りシステム（整合慣性ベース）
@@ -377,21 +463,25 @@ class NPCPriority:
         self.knowledge_huntzones = set()  # 狩場の知識
         
         # 初期知識を最小限に：最低限のリソースのみ知っている状態
-        initial_cave = self.env.nearest_nodes(self.pos(), self.env.caves, k=1)
+        initial_cave = self.env.nearest_nodes_fast(self.pos(), "caves", k=1)
         if initial_cave: self.knowledge_caves.add(initial_cave[0])
         
         # 水源知識を大幅増加（水不足を防ぐ）
-        initial_waters = self.env.nearest_nodes(self.pos(), self.env.water_sources, k=4)
+        initial_waters = self.env.nearest_nodes_fast(self.pos(), "water", k=4)
         for water in initial_waters:
             self.knowledge_water.add(water)
             
-        initial_berries = self.env.nearest_nodes(self.pos(), self.env.berries, k=1)
+        initial_berries = self.env.nearest_nodes_fast(self.pos(), "berries", k=1)
         for berry in initial_berries:
             self.knowledge_berries.add(berry)
 
     def pos(self):
         return (self.x, self.y)
         
+    def social_kappa(self):
+        # 社交の整合慣性。一度も更新していなければ 0（既定値 0.1 ではない）
+        return float(self.kappa[K_SOCIAL]) if self.social_seen else 0
+        
     def dist_to(self, o):
         return abs(self.x - o.x) + abs(self.y - o.y)
         
@@ -404,9 +494,17 @@ class NPCPriority:
         self.y += (1 if ty > self.y else -1 if ty < self.y else 0)
         self.x = max(0, min(self.env.size - 1, self.x))
         self.y = max(0, min(self.env.size - 1, self.y))
+        self.sync_pos()
+
+    def sync_pos(self):
+        self.env._npc_xy[self.rid] = self.x, self.y
         
     def nearby_allies(self, radius=3):
-        return [o for on, o in self.roster_ref.items() if on != self.name and o.alive and self.dist_to(o) <= radius]
+        # SoA 位置配列に対する1回のマスク計算（登録順＝roster 順を保つ）
+        xy = self.env._npc_xy
+        near = self.env._npc_alive & (np.abs(xy[:, 0] - self.x) + np.abs(xy[:, 1] - self.y) <= radius)
+        near[self.rid] = False
+        return [self.env._npcs[i] for i in np.flatnonzero(near)]
 
     # 拡張された探索圧力計算
     def calculate_life_crisis_pressure(self):
@@ -440,43 +538,18 @@ class NPCPriority:
         return min(4.0, crisis_pressure)  # 最大値制限
     
     def calculate_exploration_pressure(self):
-        pressure = 0.0
-        ticks_since_discovery = self.env.t - self.last_discovery_tick
-        boredom = min(1.0, ticks_since_discovery / 150.0)
-        pressure += boredom * 0.6
-        
-        # 全リソースタイプの未発見状況を考慮した探索圧力
-        total_unknown_pressure = 0.0
-        
-        if len(self.knowledge_caves) < len(self.env.caves):
-            cave_ratio = 1.0 - len(self.knowledge_caves) / len(self.env.caves)
-            total_unknown_pressure += cave_ratio * 0.25
-            
-        if len(self.knowledge_water) < len(self.env.water_sources):
-            water_ratio = 1.0 - len(self.knowledge_water) / len(self.env.water_sources)
-            total_unknown_pressure += water_ratio * 0.25
-            
-        if len(self.knowledge_berries) < len(self.env.berries):
-            berry_ratio = 1.0 - len(self.knowledge_berries) / len(self.env.berries)
-            total_unknown_pressure += berry_ratio * 0.3  # 食料は重要なので重み大
-            
-        if len(self.knowledge_huntzones) < len(self.env.huntzones):
-            hunt_ratio = 1.0 - len(self.knowledge_huntzones) / len(self.env.huntzones)
-            total_unknown_pressure += hunt_ratio * 0.2
-            
-        pressure += total_unknown_pressure
-        
-        # 探索モード中は他者の情報不足がさらなる探索圧力を生む
+        # 既知数を集めて算術はモジュール関数 exploration_pressure に任せる（総数は env にキャッシュ済み）
+        env = self.env
+        n_cave, n_water = len(self.knowledge_caves), len(self.knowledge_water)
+        n_berry, n_hunt = len(self.knowledge_berries), len(self.knowledge_huntzones)
+        # 探索モード中は他者の情報不足がさらなる探索圧力を生む（1人見つかれば十分）
+        info_bonus = 0.0
         if self.exploration_mode:
-            allies_needing_info = 0
-            for ally in self.nearby_allies(radius=100):
-                if (len(ally.knowledge_caves) < len(self.knowledge_caves) or
-                    len(ally.knowledge_berries) < len(self.knowledge_berries) or
-                    len(ally.knowledge_huntzones) < len(self.knowledge_huntzones)):
-                    allies_needing_info += 1
-            if allies_needing_info > 0: pressure += 0.3 * self.exploration_intensity
-            
-        return min(2.5, pressure)
+            if any(len(ally.knowledge_caves) < n_cave or len(ally.knowledge_berries) < n_berry or
+                   len(ally.knowledge_huntzones) < n_hunt for ally in self.nearby_allies(radius=100)):
+                info_bonus = 0.3 * self.exploration_intensity
+        return exploration_pressure(env.t - self.last_discovery_tick, n_cave, env.n_caves, n_water, env.n_water,
+                                    n_berry, env.n_berries, n_hunt, env.n_huntzones, info_bonus)
     
     def calculate_leadership_influence(self):
         """リーダーシップ影響力の計算"""
@@ -485,15 +558,14 @@ class NPCPriority:
         # 1. 情報優位性（知識の豊富さ）
         total_knowledge = (len(self.knowledge_caves) + len(self.knowledge_water) + 
                           len(self.knowledge_berries) + len(self.knowledge_huntzones))
-        max_possible_knowledge = (len(self.env.caves) + len(self.env.water_sources) + 
-                                 len(self.env.berries) + len(self.env.huntzones))
+        max_possible_knowledge = self.env.n_resources
         
         if max_possible_knowledge > 0:
             knowledge_advantage = total_knowledge / max_possible_knowledge
             influence += knowledge_advantage * 0.4
         
         # 2. 社会的整合慣性（協力経験）
-        social_experience = self.kappa.get("social", 0.1)
+        social_experience = float(self.kappa[K_SOCIAL])
         influence += social_experience * 0.3
         
         # 3. 関係性ネットワークの幅と深さ
@@ -554,7 +626,7 @@ class NPCPriority:
         mode_multiplier = self.exploration_intensity if self.exploration_mode else 1.0
         pleasure = meaning_pressure * value * 1.0 * mode_multiplier
         
-        self.kappa["exploration"] = min(1.0, self.kappa.get("exploration", 0.1) + 0.15)
+        self.kappa[K_EXPLORATION] = min(1.0, float(self.kappa[K_EXPLORATION]) + 0.15)
         self.E = min(5.0, self.E + pleasure * 0.5)
         self.T = max(self.T0, self.T - 0.3)
         self.last_discovery_tick = t
@@ -604,7 +676,7 @@ class NPCPriority:
         leap_threshold = max(0.3, leap_threshold)  # 最小閾値を維持
         
         # 整合慣性と意味圧による跳躍判定
-        exploration_experience = self.kappa.get("exploration", 0.1)
+        exploration_experience = float(self.kappa[K_EXPLORATION])
         # 未処理圧も跳躍確率に影響
         leap_probability = min(0.9, (exploration_pressure + self.E * 0.3) / 2.0) * (0.5 + exploration_experience)
         
@@ -666,7 +738,7 @@ class NPCPriority:
             self.exploration_intensity = 1.0
             
             # 探索経験を少し減衰（忘却効果）
-            self.kappa["exploration"] = max(0.05, self.kappa.get("exploration", 0.1) * 0.9)
+            self.kappa[K_EXPLORATION] = max(0.05, float(self.kappa[K_EXPLORATION]) * 0.9)
             
             self.log.append({"t": t, "name": self.name, "action": "exploration_mode_reversion", 
                            "duration": mode_duration, "stability": resource_stability,
@@ -808,9 +880,9 @@ class NPCPriority:
         base_settlement_tendency = resource_stability * (1.0 - min(1.0, exploration_pressure))
         
         # 2. 体験による定住慣性の蓄積
-        resource_experiences = getattr(self, 'settlement_experiences', {}).get('resource_stability', [])
-        social_experiences = getattr(self, 'settlement_experiences', {}).get('social_stability', [])
-        satisfaction_experiences = getattr(self, 'settlement_experiences', {}).get('exploration_satisfaction', [])
+        resource_experiences = self.settlement_experiences['resource_stability']
+        social_experiences = self.settlement_experiences['social_stability']
+        satisfaction_experiences = self.settlement_experiences['exploration_satisfaction']
         
         # 最近の体験を重視（最新10個の体験）
         recent_resource_stability = sum(resource_experiences[-10:]) / max(1, len(resource_experiences[-10:]))
@@ -852,7 +924,7 @@ class NPCPriority:
         # 3. 仲間の縄張り意識（その場所を安全だと思っている仲間の数）
         allies_claiming_territory = 0
         for npc in self.roster_ref.values():
-            if npc != self and npc.alive and hasattr(npc, 'territory') and npc.territory == location:
+            if npc != self and npc.alive and npc.territory == location:
                 allies_claiming_territory += 1
         
         # 4. 社会的安全感の計算
@@ -879,11 +951,9 @@ class NPCPriority:
         # 1. 縄張りメンバーシップ効果（この場所の「仲間」としての帰属感）
         territory_members = set()
         for npc in self.roster_ref.values():
-            if (npc.alive and hasattr(npc, 'territory') and 
-                npc.territory and npc.territory.center == location):
+            if npc.alive and npc.territory and npc.territory.center == location:
                 territory_members.add(npc.name)
-                if hasattr(npc.territory, 'social_members'):
-                    territory_members.update(npc.territory.social_members)
+                territory_members.update(npc.territory.social_members)
         
         if self.name in territory_members:
             membership_bonus = 0.4  # 「ここは自分たちの場所」感覚
@@ -891,7 +961,7 @@ class NPCPriority:
         
         # 2. 共同活動による結束（一緒に過ごした時間の価値）
         location_key = f"{location[0]}_{location[1]}"
-        shared_experiences = getattr(self, 'location_social_memories', {}).get(location_key, [])
+        shared_experiences = self.location_social_memories.get(location_key, [])
         
         # 最近の共同体験（オキシトシン分泌促進）
         recent_bonding = sum(1 for exp in shared_experiences if exp.get('recent', False))
@@ -909,12 +979,11 @@ class NPCPriority:
         oxytocin_effect += min(0.4, protection_instinct)  # 最大0.4
         
         # 4. 安心感の相互強化（基本的な縄張り一致による信頼感で循環参照を回避）
-        collective_confidence = 0.0
-        for npc in self.roster_ref.values():
-            if (npc != self and npc.alive and hasattr(npc, 'territory') and 
-                npc.territory and npc.territory.center == location):
-                # 単純な縄張り共有による信頼感（循環参照回避）
-                collective_confidence += 0.1
+        # 縄張り中心インデックスを引くだけなのでO(1)
+        sharing_npcs = self.env.territory_centers.get(location, 0)
+        if self.alive and self.territory and self.territory.center == location:
+            sharing_npcs -= 1  # 自分自身は数えない
+        collective_confidence = 0.1 * sharing_npcs
         
         oxytocin_effect += min(0.3, collective_confidence)
         
@@ -922,9 +991,6 @@ class NPCPriority:
     
     def update_social_territory_bonding(self, t, location, companion_names):
         """社会的縄張りの結束を更新"""
-        if not hasattr(self, 'location_social_memories'):
-            self.location_social_memories = {}
-            
         location_key = f"{location[0]}_{location[1]}"
         if location_key not in self.location_social_memories:
             self.location_social_memories[location_key] = []
@@ -951,7 +1017,7 @@ class NPCPriority:
             
         # コミュニティサイズの更新
         territory_at_location = None
-        if hasattr(self, 'territory') and self.territory and self.territory.center == location:
+        if self.territory and self.territory.center == location:
             territory_at_location = self.territory
             
         community_size = territory_at_location.get_community_size() if territory_at_location else 1
@@ -967,9 +1033,9 @@ class NPCPriority:
         """命の危機時の緊急生存行動（探索よりも優先）"""
         # 1. 脂水症の緊急対処（最優先）
         if self.thirst > 140:
-            known_water = {k: v for k, v in self.env.water_sources.items() if k in self.knowledge_water}
+            known_water = self.knowledge_water
             if known_water:
-                nearest_water = self.env.nearest_nodes(self.pos(), known_water, k=1)
+                nearest_water = self.env.nearest_nodes_fast(self.pos(), "water", k=1, restrict=known_water)
                 if nearest_water:
                     target = nearest_water[0]
                     if self.pos() == target:
@@ -985,9 +1051,9 @@ class NPCPriority:
         
         # 2. 餓死の緊急対処
         if self.hunger > 160:
-            known_berries = {k: v for k, v in self.env.berries.items() if k in self.knowledge_berries}
+            known_berries = self.knowledge_berries
             if known_berries:
-                nearest_berries = self.env.nearest_nodes(self.pos(), known_berries, k=1)
+                nearest_berries = self.env.nearest_nodes_fast(self.pos(), "berries", k=1, restrict=known_berries)
                 if nearest_berries:
                     target = nearest_berries[0]
                     success, food, _, _ = self.env.forage(self.pos(), target)
@@ -1002,9 +1068,9 @@ class NPCPriority:
         
         # 3. 疲労回復の緊急対処
         if self.fatigue > 80:
-            known_caves = {k: v for k, v in self.env.caves.items() if k in self.knowledge_caves}
+            known_caves = self.knowledge_caves
             if known_caves:
-                nearest_cave = self.env.nearest_nodes(self.pos(), known_caves, k=1)
+                nearest_cave = self.env.nearest_nodes_fast(self.pos(), "caves", k=1, restrict=known_caves)
                 if nearest_cave:
                     target = nearest_cave[0]
                     if self.pos() == target:
@@ -1025,19 +1091,19 @@ class NPCPriority:
             return False
             
         # 近くにいる仲間を探す
+        # 夜の接近は全候補で共通なのでループ外で一度だけ判定
+        is_night_approaching = self.env.day_night.is_night() or self.env.day_night.get_time_of_day() > 0.5
         nearby_npcs = []
         for npc in self.roster_ref.values():
-            if (npc != self and npc.alive and 
-                abs(npc.x - self.x) <= 15 and abs(npc.y - self.y) <= 15):
-                
-                # 関係性が良好で、疲労している、または夜間の場合に招待対象とする
-                relationship = self.rel.get(npc.name, 0)
-                is_tired = npc.fatigue > 60
-                is_night_approaching = self.env.day_night.is_night() or self.env.day_night.get_time_of_day() > 0.5
-                needs_shelter = not hasattr(npc, 'territory') or npc.territory is None
-                
-                if (relationship > 0.3 and (is_tired or is_night_approaching) and needs_shelter):
-                    nearby_npcs.append(npc)
+            # 安い条件から先に判定して早期に除外
+            if npc is self or not npc.alive or npc.territory is not None:
+                continue
+            if abs(npc.x - self.x) > 15 or abs(npc.y - self.y) > 15:
+                continue
+            
+            # 関係性が良好で、疲労している、または夜間の場合に招待対象とする
+            if self.rel.get(npc.name, 0) > 0.3 and (is_night_approaching or npc.fatigue > 60):
+                nearby_npcs.append(npc)
         
         if not nearby_npcs:
             return False
@@ -1053,7 +1119,7 @@ class NPCPriority:
         # 招待の受諾判定（コミュニティ形成促進のため大幅緩和）
         base_threshold = 0.2  # 0.4から下げて受け入れやすく
         empathy_bonus = invited_companion.empathy * 0.3  # 共感性ボーナスを増強
-        loneliness_factor = 0.1 if not hasattr(invited_companion, 'territory') or invited_companion.territory is None else 0.0
+        loneliness_factor = 0.1 if invited_companion.territory is None else 0.0
         companion_acceptance_threshold = base_threshold - empathy_bonus - loneliness_factor
         
         if invitation_appeal > companion_acceptance_threshold:
@@ -1061,11 +1127,10 @@ class NPCPriority:
             invited_companion.move_towards(self.territory.center)
             
             # オキシトシン的結束 - 縄張りの社会的メンバーに追加
-            if hasattr(self.territory, 'social_members'):
-                self.territory.add_member(invited_companion.name, invitation_appeal)
+            self.territory.add_member(invited_companion.name, invitation_appeal)
             
             # 相互コミュニティ参加 - 招待される側も自分のコミュニティに招待者を追加
-            if hasattr(invited_companion, 'territory') and invited_companion.territory:
+            if invited_companion.territory:
                 # 相互メンバーシップ
                 invited_companion.territory.add_member(self.name, invitation_appeal * 0.8)
                 
@@ -1079,8 +1144,10 @@ class NPCPriority:
             invited_companion.rel[self.name] = min(1.0, invited_companion.rel.get(self.name, 0) + bonding_boost)
             
             # 社交的経験の向上（両者とも）
-            self.kappa["social"] = min(1.0, self.kappa.get("social", 0) + 0.03)
-            invited_companion.kappa["social"] = min(1.0, invited_companion.kappa.get("social", 0) + 0.03)
+            self.kappa[K_SOCIAL] = min(1.0, self.social_kappa() + 0.03)
+            self.social_seen = True
+            invited_companion.kappa[K_SOCIAL] = min(1.0, invited_companion.social_kappa() + 0.03)
+            invited_companion.social_seen = True
             
             # グループ招待の連鎖効果 - 招待された人が自分の友人も連れてくる可能性
             if random.random() < 0.7 and len(nearby_npcs) > 1:  # 70%の確率でグループ招待
@@ -1243,9 +1310,6 @@ class NPCPriority:
     
     def record_settlement_experience(self, exploration_pressure, resource_stability, duration):
         """定住体験を記録して整合慣性を蓄積"""
-        if not hasattr(self, 'settlement_experiences'):
-            self.settlement_experiences = {'resource_stability': [], 'social_stability': [], 'exploration_satisfaction': []}
-        
         # リソース安定性の体験
         self.settlement_experiences['resource_stability'].append(resource_stability)
         
@@ -1289,7 +1353,7 @@ class NPCPriority:
                     if relationship > 0.6:  # 強い関係性がある場合は結合を優先
                         # コミュニティ結合 - 両者が同じ縄張りを共有
                         other_npc.territory.add_member(self.name, relationship)
-                        self.territory = other_npc.territory  # 同じ縄張りを共有
+                        self.set_territory(other_npc.territory)  # 同じ縄張りを共有
                         self.home_cave = other_npc.home_cave
                         self.log.append({"t": t, "name": self.name, "action": "community_merge",
                                        "partner": other_npc.name, "shared_territory": cave_pos,
@@ -1302,7 +1366,7 @@ class NPCPriority:
                         return False  # 主張失敗
         
         # 縄張りを確立（オキシトシン的社会縄張りとして）
-        self.territory = Territory(self.name, cave_pos, territory_radius)
+        self.set_territory(Territory(self.name, cave_pos, territory_radius))
         self.territory.social_members = set([self.name])  # 初期メンバーは自分のみ
         self.territory.bonding_strength[self.name] = 1.0  # 自分との結束は最大
         self.home_cave = cave_pos
@@ -1314,6 +1378,21 @@ class NPCPriority:
                        "safety_feeling_score": safety_feeling})
         return True
     
+    def set_territory(self, territory):
+        """縄張りを付け替え、環境の縄張り中心インデックスを更新"""
+        centers = self.env.territory_centers
+        if self.territory is not None and self.alive:
+            centers[self.territory.center] -= 1
+        self.territory = territory
+        if territory is not None and self.alive:
+            centers[territory.center] += 1
+    
+    def die(self):
+        """死亡処理（縄張り中心インデックスから除外）"""
+        if self.territory is not None and self.alive:
+            self.env.territory_centers[self.territory.center] -= 1
+        self.alive = False; self.env._npc_alive[self.rid] = False
+    
     def lose_territory(self, t, aggressor_name):
         """縄張りを失う"""
         if self.territory is None:
@@ -1323,12 +1402,10 @@ class NPCPriority:
         self.log.append({"t": t, "name": self.name, "action": "lose_territory", 
                        "old_center": old_center, "aggressor": aggressor_name})
         
-        self.territory = None
+        self.set_territory(None)
         self.home_cave = None
         self.territory_claim_strength = 0.0
         # 縄張り喪失体験として記録（整合慣性への影響）
-        if not hasattr(self, 'territory_loss_experiences'):
-            self.territory_loss_experiences = []
         self.territory_loss_experiences.append({'tick': t, 'aggressor': aggressor_name})
     
     def check_territory_intrusion(self, t):
@@ -1363,7 +1440,7 @@ class NPCPriority:
         pressure_threshold = 0.8 + (1.0 - self.curiosity) * 0.3  # 好奇心が低いほど高い闾値
         
         # 整合慣性と意味圧による跳躍判定
-        exploration_experience = self.kappa.get("exploration", 0.1)
+        exploration_experience = float(self.kappa[K_EXPLORATION])
         leap_probability = min(0.8, exploration_pressure / 2.0) * (0.5 + exploration_experience)
         
         if exploration_pressure > pressure_threshold and random.random() < leap_probability:
@@ -1410,7 +1487,7 @@ class NPCPriority:
             self.resource_stability_counter = 0
             
             # 復帰時に探索経験を少し減衰（忘却効果）
-            self.kappa["exploration"] = max(0.05, self.kappa.get("exploration", 0.1) * 0.8)
+            self.kappa[K_EXPLORATION] = max(0.05, float(self.kappa[K_EXPLORATION]) * 0.8)
             
             self.log.append({"t": t, "name": self.name, "action": "scout_reversion", 
                            "from_role": old_role, "to_role": self.role, 
@@ -1421,27 +1498,10 @@ class NPCPriority:
     
     def evaluate_resource_stability(self):
         """現在のリソース安定性を評価"""
-        stability_score = 0.0
-        
-        # 基本生理ニーズの充足度
-        hunger_stability = max(0, (70 - self.hunger) / 70)  # 空腹度が低いほど安定
-        thirst_stability = max(0, (70 - self.thirst) / 70)  # 渇きが少ないほど安定
-        fatigue_stability = max(0, (70 - self.fatigue) / 70)  # 疲労が少ないほど安定
-        
-        basic_needs = (hunger_stability + thirst_stability + fatigue_stability) / 3
-        stability_score += basic_needs * 0.6
-        
         # 知識の豊富さ（発見済みリソースの割合）
-        total_resources = (len(self.env.caves) + len(self.env.water_sources) + 
-                          len(self.env.berries) + len(self.env.huntzones))
         known_resources = (len(self.knowledge_caves) + len(self.knowledge_water) + 
                           len(self.knowledge_berries) + len(self.knowledge_huntzones))
-        
-        if total_resources > 0:
-            knowledge_ratio = known_resources / total_resources
-            stability_score += knowledge_ratio * 0.4
-        
-        return min(1.0, stability_score)
+        return resource_stability(self.hunger, self.thirst, self.fatigue, known_resources, self.env.n_resources)
 
     def consider_retirement(self, t):
         """引退を検討する"""
@@ -1511,8 +1571,9 @@ class NPCPriority:
         # 経験値の一部伝承
         transferred_exp = self.experience_points * 0.3
         mentee.experience_points += transferred_exp
-        mentee.kappa["exploration"] = min(1.0, mentee.kappa["exploration"] + 0.1)
-        mentee.kappa["social"] = min(1.0, mentee.kappa["social"] + 0.05)
+        mentee.kappa[K_EXPLORATION] = min(1.0, float(mentee.kappa[K_EXPLORATION]) + 0.1)
+        mentee.kappa[K_SOCIAL] = min(1.0, float(mentee.kappa[K_SOCIAL]) + 0.05)
+        mentee.social_seen = True
         
         # 関係性の向上
         mentee.rel[self.name] = min(1.0, mentee.rel.get(self.name, 0) + 0.8)
@@ -1554,7 +1615,8 @@ class NPCPriority:
         """継続的な指導を提供"""
         # 小さな経験値ボーナス
         mentee.experience_points += 0.2
-        mentee.kappa["social"] = min(1.0, mentee.kappa["social"] + 0.02)
+        mentee.kappa[K_SOCIAL] = min(1.0, float(mentee.kappa[K_SOCIAL]) + 0.02)
+        mentee.social_seen = True
         
         # 関係性の維持・強化
         mentee.rel[self.name] = min(1.0, mentee.rel.get(self.name, 0) + 0.1)
@@ -1598,7 +1660,8 @@ class NPCPriority:
             approval_multiplier = 1.0 + (total_approval / shared_count) * 0.5
             cooperation_bonus = 1.2 if shared_count >= 2 else 1.0
             total_pleasure = base_pleasure * approval_multiplier * cooperation_bonus
-            self.kappa["social"] = min(1.0, self.kappa.get("social", 0.1) + 0.05 * shared_count)
+            self.kappa[K_SOCIAL] = min(1.0, float(self.kappa[K_SOCIAL]) + 0.05 * shared_count)
+            self.social_seen = True
             
             # 引退システム：共有経験の蓄積
             self.experience_points += total_pleasure * 0.2
@@ -1625,20 +1688,21 @@ class NPCPriority:
         new_y = self.y + dy
         self.x = max(0, min(self.env.size - 1, new_x))
         self.y = max(0, min(self.env.size - 1, new_y))
+        self.sync_pos()
 
         # 探索モード中は発見範囲が拡大
         detection_range = 3 if self.exploration_intensity > 1.3 else 2
         
         # 全てのリソースタイプで新しい発見をチェック
         resource_types = [
-            ("cave", self.env.caves, self.knowledge_caves),
-            ("water", self.env.water_sources, self.knowledge_water),
-            ("berry_patch", self.env.berries, self.knowledge_berries),
-            ("hunting_ground", self.env.huntzones, self.knowledge_huntzones)
+            ("cave", "caves", self.knowledge_caves),
+            ("water", "water", self.knowledge_water),
+            ("berry_patch", "berries", self.knowledge_berries),
+            ("hunting_ground", "huntzones", self.knowledge_huntzones)
         ]
         
-        for res_type, res_dict, knowledge in resource_types:
-            nearest = self.env.nearest_nodes(self.pos(), res_dict, k=1)
+        for res_type, kind, knowledge in resource_types:
+            nearest = self.env.nearest_nodes_fast(self.pos(), kind, k=1)
             if nearest:
                 distance = self.dist_to_pos(nearest[0])
                 already_known = nearest[0] in knowledge
@@ -1653,7 +1717,7 @@ class NPCPriority:
                         safety_bonus = self.env.caves[nearest[0]]["safety_bonus"]
                         # 安全性の高い洞窟ほど大きな発見喜び
                         extra_pleasure = safety_bonus * 5
-                        self.kappa["exploration"] = min(1.0, self.kappa.get("exploration", 0.1) + extra_pleasure * 0.1)
+                        self.kappa[K_EXPLORATION] = min(1.0, float(self.kappa[K_EXPLORATION]) + extra_pleasure * 0.1)
                         self.log.append({"t": t, "name": self.name, "action": "discover_valuable_cave", 
                                        "location": nearest[0], "safety_bonus": safety_bonus, 
                                        "extra_pleasure": extra_pleasure})
@@ -1738,15 +1802,14 @@ class NPCPriority:
         if self.hunger >= 200 or self.thirst >= 180:
             # 死因の記録
             death_cause = "starvation" if self.hunger >= 200 else "dehydration"
-            exploration_duration = getattr(self, 'exploration_start_tick', 0)
-            exploration_mode_duration = t - exploration_duration if hasattr(self, 'exploration_start_tick') else 0
+            exploration_mode_duration = t - self.exploration_mode_start_tick if self.exploration_mode else 0
             
             self.log.append({"t": t, "name": self.name, "action": "death", 
                            "cause": death_cause, "hunger": self.hunger, "thirst": self.thirst,
                            "fatigue": self.fatigue, "exploration_mode": self.exploration_mode,
                            "exploration_duration": exploration_mode_duration,
                            "territories_claimed": 1 if self.territory else 0})
-            self.alive = False
+            self.die()
             return
 
         # 引退システム：年齢更新と引退判定（無効化中）
@@ -1766,9 +1829,9 @@ class NPCPriority:
         
         # 疲労による強制休憩（探索モードよりも優先）
         if self.fatigue > 60:  # 疲労度60%超えで強制休憩（条件緩和）
-            known_caves = {k: v for k, v in self.env.caves.items() if k in self.knowledge_caves}
+            known_caves = self.knowledge_caves
             if known_caves:
-                cave_nodes = self.env.nearest_nodes(self.pos(), known_caves, k=1)
+                cave_nodes = self.env.nearest_nodes_fast(self.pos(), "caves", k=1, restrict=known_caves)
                 if cave_nodes:
                     target = cave_nodes[0]
                     if self.pos() == target:
@@ -1834,9 +1897,9 @@ class NPCPriority:
         # 基本的な生存行動
         # 悪天候時の洞窟避難（雨の強度が高い場合）
         if self.env.weather.condition == "rainy" and self.env.weather.intensity > 0.6:
-            known_caves = {k: v for k, v in self.env.caves.items() if k in self.knowledge_caves}
+            known_caves = self.knowledge_caves
             if known_caves:
-                cave_nodes = self.env.nearest_nodes(self.pos(), known_caves, k=1)
+                cave_nodes = self.env.nearest_nodes_fast(self.pos(), "caves", k=1, restrict=known_caves)
                 if cave_nodes:
                     target = cave_nodes[0]
                     if self.pos() == target:
@@ -1879,16 +1942,16 @@ class NPCPriority:
             
             # 危険度が閾値を超えるか、既に野宿中の場合は洞窟を探す
             should_seek_shelter = (night_danger_assessment['total_danger'] > 0.25 or 
-                                 getattr(self, 'camping_outdoors', False))
+                                 self.camping_outdoors)
             
             if should_seek_shelter:
-                known_caves = {k: v for k, v in self.env.caves.items() if k in self.knowledge_caves}
+                known_caves = self.knowledge_caves
                 if known_caves:
                     # ホーム洞窟があればそこに、なければ最も近い洞窟に
                     if self.home_cave and self.home_cave in known_caves:
                         target = self.home_cave
                     else:
-                        cave_nodes = self.env.nearest_nodes(self.pos(), known_caves, k=1)
+                        cave_nodes = self.env.nearest_nodes_fast(self.pos(), "caves", k=1, restrict=known_caves)
                         if cave_nodes:
                             target = cave_nodes[0]
                         else:
@@ -1964,9 +2027,9 @@ class NPCPriority:
                     
         # 高疲労時の洞窟での休憩（闾値を下げて促進）
         if self.fatigue > 60:
-            known_caves = {k: v for k, v in self.env.caves.items() if k in self.knowledge_caves}
+            known_caves = self.knowledge_caves
             if known_caves:
-                cave_nodes = self.env.nearest_nodes(self.pos(), known_caves, k=1)
+                cave_nodes = self.env.nearest_nodes_fast(self.pos(), "caves", k=1, restrict=known_caves)
                 if cave_nodes:
                     target = cave_nodes[0]
                     if self.pos() == target:
@@ -2024,7 +2087,7 @@ class NPCPriority:
         # 水分補給（命の危機に応じて闾値調整）
         water_threshold = 90 - (life_crisis * 30)  # 危機時は早めに水分補給
         if self.thirst > max(60, water_threshold):  # 最低60で水分補給
-            known_water = self.env.nearest_nodes(self.pos(), {k:v for k,v in self.env.water_sources.items() if k in self.knowledge_water}, k=1)
+            known_water = self.env.nearest_nodes_fast(self.pos(), "water", k=1, restrict=self.knowledge_water)
             if known_water:
                 target = known_water[0]
                 if self.pos() == target:
@@ -2039,12 +2102,12 @@ class NPCPriority:
         
         if self.hunger > 100:  # 食事の闾値を緩和
             # 既知のベリー採取場所を優先的に探す
-            known_berries = {k: v for k, v in self.env.berries.items() if k in self.knowledge_berries}
+            known_berries = self.knowledge_berries
             if known_berries:
-                nodes = self.env.nearest_nodes(self.pos(), known_berries, k=1)
+                nodes = self.env.nearest_nodes_fast(self.pos(), "berries", k=1, restrict=known_berries)
             else:
                 # 既知の場所がない場合は近くを探索
-                nodes = self.env.nearest_nodes(self.pos(), self.env.berries, k=1)
+                nodes = self.env.nearest_nodes_fast(self.pos(), "berries", k=1)
                 # 新しい場所を発見した場合は知識に追加
                 if nodes and nodes[0] not in self.knowledge_berries:
                     self.knowledge_berries.add(nodes[0])
@@ -2411,7 +2474,7 @@ if __name__ == "__main__":
             max_social_score = 0
             for npc in final_npcs:
                 if npc.alive:
-                    social_score = sum(npc.rel.values()) + npc.kappa.get("social", 0) * 5
+                    social_score = sum(npc.rel.values()) + npc.social_kappa() * 5
                     if social_score > max_social_score:
                         max_social_score = social_score
                         most_social = npc
@@ -2478,8 +2541,8 @@ if __name__ == "__main__":
                     
                     # コミュニティサイズと生存率の相関分析
                     if len(community_sizes) > 1:
-                        isolated_npcs = [npc for npc in final_npcs if npc.alive and (not hasattr(npc, 'territory') or npc.territory is None)]
-                        community_members = [npc for npc in final_npcs if npc.alive and hasattr(npc, 'territory') and npc.territory is not None]
+                        isolated_npcs = [npc for npc in final_npcs if npc.alive and npc.territory is None]
+                        community_members = [npc for npc in final_npcs if npc.alive and npc.territory is not None]
                         
                         print(f"\nSurvival analysis:")
                         print(f"Isolated survivors: {len(isolated_npcs)}")
@@ -70,17 +70,23 @@ class Predator:
     def distance_to(self, pos):
         return math.sqrt((self.x - pos[0])**2 + (self.y - pos[1])**2)
         
+    def distance_sq_to(self, pos):
+        dx = self.x - pos[0]
+        dy = self.y - pos[1]
+        return dx*dx + dy*dy
+        
     def hunt_step(self, npcs):
         """NPCを狩る行動"""
         if not self.alive:
             return None
             
-        nearby_npcs = [npc for npc in npcs if npc.alive and self.distance_to(npc.pos()) <= self.hunt_radius]
+        r2 = self.hunt_radius * self.hunt_radius
+        nearby_npcs = [npc for npc in npcs if npc.alive and self.distance_sq_to(npc.pos()) <= r2]
         if not nearby_npcs:
             return None
             
-        target = min(nearby_npcs, key=lambda n: self.distance_to(n.pos()))
-        nearby_defenders = len([npc for npc in nearby_npcs if self.distance_to(npc.pos()) <= 3])
+        target = min(nearby_npcs, key=lambda n: self.distance_sq_to(n.pos()))
+        nearby_defenders = len([npc for npc in nearby_npcs if self.distance_sq_to(npc.pos()) <= 9])
         
         # 集団防御の効果
         attack_success_rate = self.aggression - (nearby_defenders * 0.3)
@@ -96,6 +102,7 @@ class Territory:
     def __init__(self, center, radius=5, owner=None):
         self.center = center
         self.radius = radius
+        self.radius_sq = radius * radius
         self.owner = owner
         self.members = set()
         if owner:
@@ -105,7 +112,9 @@ class Territory:
     def contains(self, pos):
         x, y = pos
         cx, cy = self.center
-        return math.sqrt((x-cx)**2 + (y-cy)**2) <= self.radius
+        dx = x - cx
+        dy = y - cy
+        return dx*dx + dy*dy <= self.radius_sq
         
     def add_member(self, npc_name):
         self.members.add(npc_name)
@@ -157,7 +166,7 @@ class Environment:
     def nearest_nodes(self, pos, nodes_dict, k=3):
         if not nodes_dict:
             return []
-        distances = [(node_pos, math.sqrt((pos[0]-node_pos[0])**2 + (pos[1]-node_pos[1])**2)) 
+        distances = [(node_pos, (pos[0]-node_pos[0])**2 + (pos[1]-node_pos[1])**2) 
                     for node_pos in nodes_dict.values()]
         distances.sort(key=lambda x: x[1])
         return [pos for pos, _ in distances[:k]]
@@ -198,6 +207,7 @@ class NPC:
         self.knowledge_water = set()
         self.knowledge_berries = set()
         self.knowledge_hunting = set()
+        self.safety_event_counts = defaultdict(int)  # 場所 → 安全体験回数
         
         # 縄張りとコミュニティ
         self.territory = None
@@ -230,6 +240,11 @@ class NPC:
     def distance_to(self, pos):
         return math.sqrt((self.x - pos[0])**2 + (self.y - pos[1])**2)
     
+    def distance_sq_to(self, pos):
+        dx = self.x - pos[0]
+        dy = self.y - pos[1]
+        return dx*dx + dy*dy
+    
     def move_towards(self, target):
         """目標に向かって移動"""
         tx, ty = target
@@ -388,8 +403,11 @@ class NPC:
         nearby_predators = []
         
         for predator in self.env.predators:
-            if predator.alive and self.distance_to(predator.pos()) <= 10:
-                distance = self.distance_to(predator.pos())
+            if not predator.alive:
+                continue
+            d2 = self.distance_sq_to(predator.pos())
+            if d2 <= 100:
+                distance = math.sqrt(d2)
                 threat = (10 - distance) / 10 * predator.aggression
                 threat_level += threat
                 nearby_predators.append(predator)
@@ -403,11 +421,11 @@ class NPC:
         if threat_level > 0.3:
             # 近くの仲間を探す
             nearby_npcs = [npc for npc in self.roster.values() 
-                          if npc != self and npc.alive and self.distance_to(npc.pos()) <= 15]
+                          if npc != self and npc.alive and self.distance_sq_to(npc.pos()) <= 225]
             
             if nearby_npcs:
                 # 最も近い仲間のところに向かう
-                closest_ally = min(nearby_npcs, key=lambda n: self.distance_to(n.pos()))
+                closest_ally = min(nearby_npcs, key=lambda n: self.distance_sq_to(n.pos()))
                 self.move_towards(closest_ally.pos())
                 
                 self.log.append({"t": t, "name": self.name, "action": "group_protection", 
@@ -422,13 +440,7 @@ class NPC:
         intrinsic_safety = 0.7  # 洞窟の基本安全性
         
         # 2. 体験に基づく安全感
-        cave_name = next((k for k, v in self.env.caves.items() if v == cave_pos), None)
-        safety_events = 0
-        if cave_name:
-            for log_entry in self.log:
-                if (log_entry.get("location") == cave_pos and 
-                    log_entry.get("action") in ["rest_in_cave", "safe_shelter"]):
-                    safety_events += 1
+        safety_events = self.safety_event_counts.get(cave_pos, 0)
         
         experiential_safety = min(1.0, safety_events / 3.0)
         
@@ -449,7 +461,7 @@ class NPC:
     def calculate_social_safety_at_location(self, location):
         """特定場所での社会的安全感"""
         nearby_npcs = [npc for npc in self.roster.values() 
-                      if npc != self and npc.alive and npc.distance_to(location) <= 5]
+                      if npc != self and npc.alive and npc.distance_sq_to(location) <= 25]
         
         if not nearby_npcs:
             return 0.0
@@ -512,7 +524,7 @@ class NPC:
             
         nearby_npcs = [npc for npc in self.roster.values() 
                       if npc != self and npc.alive and npc.territory is None and 
-                      self.distance_to(npc.pos()) <= 12]
+                      self.distance_sq_to(npc.pos()) <= 144]
         
         for npc in nearby_npcs:
             if random.random() < 0.7:  # 70%の確率で招待
@@ -654,7 +666,9 @@ class NPC:
                     if safety_feeling >= self.territory_claim_threshold and not self.territory:
                         self.claim_cave_territory(best_cave, t)
                     
+                    self.safety_event_counts[best_cave] += 1
                     self.log.append({"t": t, "name": self.name, "action": "rest_in_cave", 
+                                   "location": best_cave,
                                    "recovery": total_recovery, "safety_feeling": safety_feeling})
                 else:
                     self.move_towards(best_cave)
@@ -683,13 +697,14 @@ class NPC:
     def discover_nearby_resources(self, t, target_type):
         """近くのリソースを発見"""
         discovery_radius = 5
+        r2 = discovery_radius * discovery_radius
         discovered = False
         
         # 水源の発見
         if target_type in ["water", "any"]:
             for water_name, water_pos in self.env.water_sources.items():
                 if (water_name not in self.knowledge_water and 
-                    self.distance_to(water_pos) <= discovery_radius):
+                    self.distance_sq_to(water_pos) <= r2):
                     self.knowledge_water.add(water_name)
                     self.record_discovery_experience(t, "water", 0.8)
                     discovered = True
@@ -698,7 +713,7 @@ class NPC:
         if target_type in ["food", "any"]:
             for berry_name, berry_pos in self.env.berries.items():
                 if (berry_name not in self.knowledge_berries and 
-                    self.distance_to(berry_pos) <= discovery_radius):
+                    self.distance_sq_to(berry_pos) <= r2):
                     self.knowledge_berries.add(berry_name)
                     self.record_discovery_experience(t, "berries", 0.7)
                     discovered = True
@@ -707,7 +722,7 @@ class NPC:
         if target_type in ["shelter", "any"]:
             for cave_name, cave_pos in self.env.caves.items():
                 if (cave_name not in self.knowledge_caves and 
-                    self.distance_to(cave_pos) <= discovery_radius):
+                    self.distance_sq_to(cave_pos) <= r2):
                     self.knowledge_caves.add(cave_name)
                     self.record_discovery_experience(t, "cave", 0.9)
                     discovered = True
@@ -745,10 +760,10 @@ class NPC:
         else:
             # 社会的行動
             nearby_npcs = [npc for npc in self.roster.values() 
-                          if npc != self and npc.alive and self.distance_to(npc.pos()) <= 8]
+                          if npc != self and npc.alive and self.distance_sq_to(npc.pos()) <= 64]
             
             if nearby_npcs and random.random() < self.sociability:
-                closest_npc = min(nearby_npcs, key=lambda n: self.distance_to(n.pos()))
+                closest_npc = min(nearby_npcs, key=lambda n: self.distance_sq_to(n.pos()))
                 self.move_towards(closest_npc.pos())
                 self.log.append({"t": t, "name": self.name, "action": "socialize", 
                                "target": closest_npc.name})